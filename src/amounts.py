@@ -0,0 +1,99 @@
+"""
+Exact columnar storage of uint256 token amounts.
+
+Raw token amounts (e.g. 5126709960000000000000000) do not fit in int64, so
+they cannot be stored in a plain numpy integer array. AmountArray keeps
+each amount exactly as four little-endian uint64 limbs, and converts them
+to float64 (optionally in human units, given the token decimals) with
+array operations when they need to be aggregated.
+"""
+
+import numpy as np
+
+NR_LIMBS = 4
+
+
+def _bit_length(values):
+    """Bit length of every uint64 value."""
+    values = values.copy()
+    nr_bits = np.zeros(len(values), dtype=np.int64)
+    for s in (32, 16, 8, 4, 2, 1):
+        above = values >> np.uint64(s) != 0
+        values = np.where(above, values >> np.uint64(s), values)
+        nr_bits += above * s
+    return nr_bits + (values != 0)
+
+
+def encode(values):
+    """Little-endian limbs of the given python ints, as bytes."""
+    try:
+        return b''.join(v.to_bytes(8 * NR_LIMBS, 'little') for v in values)
+    except OverflowError:
+        raise ValueError("Amounts must be non negative and fit in 256 bits.")
+
+
+class AmountArray:
+
+    def __init__(self, limbs):
+        """limbs: array of shape (n, NR_LIMBS), dtype uint64."""
+        self.limbs = limbs
+
+    @classmethod
+    def from_ints(cls, values):
+        return cls(np.frombuffer(encode(values), dtype='<u8').reshape(-1, NR_LIMBS))
+
+    def to_ints(self):
+        data = np.ascontiguousarray(self.limbs, dtype='<u8').tobytes()
+        step = 8 * NR_LIMBS
+        return [
+            int.from_bytes(data[i:i + step], 'little')
+            for i in range(0, len(data), step)
+        ]
+
+    def __len__(self):
+        return len(self.limbs)
+
+    def __getitem__(self, i):
+        if isinstance(i, (int, np.integer)):
+            return AmountArray(self.limbs[i][None, :]).to_ints()[0]
+        return AmountArray(self.limbs[i])
+
+    def to_float(self):
+        """Amounts as float64, rounded to nearest as float(int) does."""
+        limbs = np.asarray(self.limbs, dtype=np.uint64).reshape(-1, NR_LIMBS)
+        rows = np.arange(len(limbs))
+        # Bit length of every amount.
+        nonzero = limbs != 0
+        top = np.where(nonzero.any(axis=1), NR_LIMBS - 1 - np.argmax(nonzero[:, ::-1], axis=1), 0)
+        nr_bits = 64 * top + _bit_length(limbs[rows, top])
+        # Amounts of more than 64 bits are rounded to their first 64 bits,
+        # with the last one set if any of the bits after them is (round to
+        # odd), so that rounding these 64 bits to 53 is the same as
+        # rounding the whole amount.
+        shift = np.maximum(nr_bits - 64, 0)
+        q, r = shift // 64, (shift % 64).astype(np.uint64)
+        low = limbs[rows, q]
+        high = limbs[rows, np.minimum(q + 1, NR_LIMBS - 1)]
+        shifted = r > 0
+        mantissa = np.where(
+            shifted, (low >> r) | (high << (np.uint64(64) - np.where(shifted, r, 1))), low)
+        lower_limbs = np.arange(NR_LIMBS) < q[:, None]
+        sticky = np.any(nonzero & lower_limbs, axis=1) | \
+            (shifted & ((low << (np.uint64(64) - np.where(shifted, r, 1))) != 0))
+        mantissa |= sticky.astype(np.uint64)
+        return np.ldexp(mantissa.astype(np.float64), shift).reshape(np.shape(self.limbs)[:-1])
+
+    def to_human(self, decimals):
+        """Amounts as float64 in token units, given the decimals of the
+        token of every amount (or the same decimals for all of them)."""
+        return self.to_float() * 10.0 ** -np.asarray(decimals, dtype=np.float64)
+
+    def sum(self):
+        """Exact sum, as a python int."""
+        # Summing the 32 bit halves of every limb cannot overflow uint64
+        # for less than 2**32 amounts.
+        lo = (self.limbs & np.uint64(0xffffffff)).sum(axis=0, dtype=np.uint64)
+        hi = (self.limbs >> np.uint64(32)).sum(axis=0, dtype=np.uint64)
+        return sum(
+            (int(lo[i]) + (int(hi[i]) << 32)) << (64 * i) for i in range(NR_LIMBS)
+        )
@@ -0,0 +1,173 @@
+"""
+Out-of-core evaluation of match_probability.py over a swap store.
+
+The block axis is processed in chunks of chunk_nr_blocks blocks. Only the
+orders of one chunk, plus the k - 1 following blocks that the windows
+starting in the chunk reach, are loaded at a time, and the number of
+windows with a counter order of every pair is accumulated across chunks.
+Arbitrageurs are identified beforehand from the number of orders of every
+address over the whole range, which is counted on the store columns
+without building the orders.
+
+Memory is bounded by the chunk size (plus a counter per address), and the
+results are identical to loading the whole range in a SwapDataset.
+"""
+
+import numpy as np
+
+from . import interning
+from .match_probability import counter_occurrences, count_hit_windows
+from .sampling import sample_keys
+from .swap_dataset import SwapDataset, arbitrageur_mask, store_rows
+
+
+def _axis(store, from_block, to_block):
+    if from_block is None:
+        from_block = int(store.block[0])
+    if to_block is None:
+        to_block = int(store.block[-1])
+    return from_block, to_block - from_block + 1
+
+
+def iter_address_order_counts(store, split=True, data_usage_percentage=100, seed=0,
+                              from_block=None, to_block=None, chunk_size=1000000):
+    """Yield, for every chunk of chunk_size swaps, (address ids, number of
+    orders) of the swaps that SwapDataset.from_store would load with the
+    same arguments, addresses being shared interning ids."""
+    first_row, last_row = store_rows(store, from_block, to_block)
+    _, address_ids = store.interned_ids()
+    for start in range(first_row, last_row, chunk_size):
+        end = min(start + chunk_size, last_row)
+        sampled = sample_keys(seed, store.block[start:end], store.index[start:end]) * 100 \
+            < data_usage_percentage
+        if split:
+            nr_orders = np.diff(store.hop_offsets[start:end + 1]) - 1
+        else:
+            nr_orders = np.ones(end - start, dtype=np.int64)
+        yield address_ids[store.address[start:end][sampled]], nr_orders[sampled]
+
+
+def address_directions(store, address_ids, split=True, data_usage_percentage=100, seed=0,
+                       from_block=None, to_block=None, chunk_size=1000000):
+    """Distinct (sell token, buy token) of the orders of the given addresses
+    (shared interning ids) that SwapDataset.from_store would load with the
+    same arguments. Only the swaps of these addresses are read, found on
+    the address column of the store."""
+    token_ids, store_address_ids = store.interned_ids()
+    store_ids = np.flatnonzero(np.isin(store_address_ids, address_ids))
+    hop_offsets = np.asarray(store.hop_offsets)
+    first_row, last_row = store_rows(store, from_block, to_block)
+    directions = [np.zeros((0, 2), dtype=np.int64)]
+    for start in range(first_row, last_row, chunk_size):
+        end = min(start + chunk_size, last_row)
+        rows = start + np.flatnonzero(np.isin(store.address[start:end], store_ids))
+        rows = rows[sample_keys(seed, store.block[rows], store.index[rows]) * 100
+                    < data_usage_percentage]
+        if split:
+            nr_hops = hop_offsets[rows + 1] - hop_offsets[rows] - 1
+            sell = np.repeat(hop_offsets[rows], nr_hops) + \
+                np.arange(nr_hops.sum()) - np.repeat(np.cumsum(nr_hops) - nr_hops, nr_hops)
+            buy = sell + 1
+        else:
+            sell = hop_offsets[rows]
+            buy = hop_offsets[rows + 1] - 1
+        directions.append(np.stack([token_ids[store.hop_tokens[sell]],
+                                    token_ids[store.hop_tokens[buy]]], axis=1))
+    return np.unique(np.concatenate(directions), axis=0)
+
+
+def count_orders_by_address(store, split=True, data_usage_percentage=100, seed=0,
+                            from_block=None, to_block=None, chunk_size=1000000):
+    """Number of orders of every address (by shared interning id) that
+    SwapDataset.from_store would load with the same arguments."""
+    # the addresses of the store might not be interned yet
+    counts = np.zeros(len(interning.addresses) + len(store.addresses), dtype=np.int64)
+    for address_ids, nr_orders in iter_address_order_counts(
+            store, split, data_usage_percentage, seed, from_block, to_block, chunk_size):
+        counts += np.bincount(address_ids, weights=nr_orders, minlength=len(counts)).astype(np.int64)
+    return counts[:len(interning.addresses)]
+
+
+def iter_chunks(store, chunk_nr_blocks, overlap=0, split=True, data_usage_percentage=100,
+                seed=0, from_block=None, to_block=None, arbitrageurs=None,
+                first_position=0):
+    """Yield (position of the first block of the chunk, dataset of the
+    chunk and of the overlap blocks following it), for the chunks from
+    the block at first_position of the axis on."""
+    first_block, nr_blocks = _axis(store, from_block, to_block)
+    for start in range(first_position, nr_blocks, chunk_nr_blocks):
+        stop = min(start + chunk_nr_blocks + overlap, nr_blocks)
+        dataset = SwapDataset.from_store(
+            store, split, data_usage_percentage, seed,
+            first_block + start, first_block + stop - 1)
+        if arbitrageurs is not None:
+            dataset = dataset.exclude_addresses(arbitrageurs)
+        yield start, dataset
+
+
+def store_arbitrageurs(store, split=True, data_usage_percentage=100, seed=0,
+                       from_block=None, to_block=None,
+                       max_amount_swaps_retail_traders=50, fraction_to_remove=None):
+    """Shared interning ids of the addresses removed by
+    SwapDataset.filter_out_arbitrageurs."""
+    counts = count_orders_by_address(
+        store, split, data_usage_percentage, seed, from_block, to_block)
+    return np.flatnonzero(arbitrageur_mask(
+        counts, max_amount_swaps_retail_traders, fraction_to_remove))
+
+
+def chunked_focus_pairs(store, chunk_nr_blocks, split=True, data_usage_percentage=100,
+                        seed=0, from_block=None, to_block=None, arbitrageurs=None):
+    """Same as SwapDataset.focus_pairs, one chunk at a time."""
+    _, nr_blocks = _axis(store, from_block, to_block)
+    pairs = []
+    for start, dataset in iter_chunks(
+            store, chunk_nr_blocks, 0, split, data_usage_percentage, seed,
+            from_block, to_block, arbitrageurs):
+        # the first and the last block of the whole axis are ignored
+        rows = slice(dataset.block_offsets[1 if start == 0 else 0],
+                     dataset.block_offsets[min(dataset.nr_blocks, nr_blocks - 1 - start)])
+        pairs.append(np.stack([dataset.sell_token[rows], dataset.buy_token[rows]], axis=1))
+    pairs = np.unique(np.concatenate(pairs), axis=0)
+    return [tuple(p) for p in pairs.tolist()]
+
+
+def chunked_hit_counts(store, focus_pairs, waiting_times, chunk_nr_blocks,
+                       split=True, data_usage_percentage=100, seed=0,
+                       from_block=None, to_block=None, arbitrageurs=None,
+                       first_starts=None):
+    """Number of windows of every waiting time k with a counter order of
+    each focus pair, for the window starts first_starts[j] <= s <=
+    nr_blocks - k (the windows of match_probabilities if not given).
+
+    Only the blocks from min(first_starts) on are read.
+    """
+    _, nr_blocks = _axis(store, from_block, to_block)
+    if first_starts is None:
+        first_starts = [1] * len(waiting_times)
+    hits = np.zeros((len(focus_pairs), len(waiting_times)), dtype=np.int64)
+    # windows starting in a chunk reach max(waiting_times) - 1 blocks further
+    overlap = max(waiting_times) - 1
+    for start, dataset in iter_chunks(
+            store, chunk_nr_blocks, overlap, split, data_usage_percentage, seed,
+            from_block, to_block, arbitrageurs, max(0, min(first_starts))):
+        pair, position = counter_occurrences(dataset, focus_pairs)
+        for j, k in enumerate(waiting_times):
+            first_start = max(first_starts[j], start)
+            last_start = min(start + chunk_nr_blocks, nr_blocks - k + 1)
+            if first_start < last_start:
+                hits[:, j] += count_hit_windows(
+                    pair, position, len(focus_pairs), k,
+                    first_start - start, last_start - start)
+    return hits
+
+
+def chunked_match_probabilities(store, focus_pairs, waiting_times, chunk_nr_blocks,
+                                split=True, data_usage_percentage=100, seed=0,
+                                from_block=None, to_block=None, arbitrageurs=None):
+    """Same as match_probability.match_probabilities, one chunk at a time."""
+    _, nr_blocks = _axis(store, from_block, to_block)
+    hits = chunked_hit_counts(
+        store, focus_pairs, waiting_times, chunk_nr_blocks, split,
+        data_usage_percentage, seed, from_block, to_block, arbitrageurs)
+    return hits / (nr_blocks - np.asarray(waiting_times))
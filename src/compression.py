@@ -0,0 +1,191 @@
+"""
+Transparent compression of the csv and json data files.
+
+open_file works like open, but when the file name ends in .gz, .bz2, .xz
+or .zst the data is (de)compressed on the fly while it is read or written,
+so a compressed file is never inflated on disk. Csv files are also parsed
+as a stream, and so are json documents with JsonStream: the members of a
+large array or object are decoded one at a time, and the members that are
+not needed are skipped without keeping them, e.g.
+
+    with open_file('per_block.json.gz') as f:
+        for order in iter_json(f, 'orders'):
+            ...
+"""
+
+import bz2
+import gzip
+import json
+import lzma
+import os
+
+
+def _open_zstd(filename, mode, **kwargs):
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError(
+            f"Reading or writing {filename} requires the zstandard package "
+            "(pip install zstandard)."
+        )
+    return zstandard.open(filename, mode, **kwargs)
+
+
+OPENERS = {
+    '.gz': gzip.open,
+    '.bz2': bz2.open,
+    '.xz': lzma.open,
+    '.zst': _open_zstd,
+}
+
+
+def open_file(filename, mode='r', **kwargs):
+    filename = str(filename)
+    for extension, opener in OPENERS.items():
+        if filename.endswith(extension):
+            # compressed streams are binary by default and have no '+' mode
+            mode = mode.replace('+', '')
+            if 'b' not in mode and 't' not in mode:
+                mode += 't'
+            return opener(filename, mode, **kwargs)
+    return open(filename, mode, **kwargs)
+
+
+def find_file(filename):
+    """Return filename, or the name of its compressed version if only that
+    one exists."""
+    for extension in [''] + list(OPENERS):
+        if os.path.exists(filename + extension):
+            return filename + extension
+    return filename
+
+
+_NUMBER_CHARS = '0123456789.eE+-'
+
+
+class JsonStream:
+    """Incremental decoder of the json document read from a text file.
+
+    The next value of the document is read with value(), which decodes it
+    whole, skip(), or keys() and elements() if it is an object or an array:
+    these yield its keys (or indices) one at a time, and the value of every
+    one must be read before the next one is yielded. Memory is bounded by
+    the largest value decoded at once, not by the size of the document.
+    """
+
+    def __init__(self, f, chunk_size=1 << 16):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _read(self):
+        # reads at least as much as is buffered, so that decoding a value
+        # spanning many chunks is retried a logarithmic number of times
+        chunk = self.f.read(max(self.chunk_size, len(self.buffer) - self.pos))
+        self.eof = chunk == ''
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+
+    def _peek(self):
+        """Next character that is not whitespace, '' at the end."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in ' \t\n\r':
+                self.pos += 1
+            if self.pos < len(self.buffer) or self.eof:
+                return self.buffer[self.pos:self.pos + 1]
+            self._read()
+
+    def _expect(self, chars):
+        c = self._peek()
+        if c == '' or c not in chars:
+            raise ValueError(f"Expected one of {chars!r} in json document, found {c!r}.")
+        self.pos += 1
+        return c
+
+    def value(self):
+        """Decode the next value."""
+        self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # a number may continue in the next chunk, unless the
+                # character after it is buffered and ends it
+                if self.eof or (end < len(self.buffer) and self.buffer[end] not in _NUMBER_CHARS):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._read()
+
+    def keys(self):
+        """Keys of the next value, an object."""
+        self._expect('{')
+        if self._peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self._expect(':')
+            yield key
+            if self._expect(',}') == '}':
+                return
+
+    def elements(self):
+        """Indices of the elements of the next value, an array."""
+        self._expect('[')
+        if self._peek() == ']':
+            self.pos += 1
+            return
+        i = 0
+        while True:
+            yield i
+            if self._expect(',]') == ']':
+                return
+            i += 1
+
+    def skip(self):
+        """Skip the next value, decoding one of its members at a time."""
+        c = self._peek()
+        if c == '{':
+            for _ in self.keys():
+                self.value()
+        elif c == '[':
+            for _ in self.elements():
+                self.value()
+        else:
+            self.value()
+
+
+def iter_json(f, key):
+    """Elements of the array, or (key, value) members of the object, under
+    key in the top-level object of the json file f, decoded one at a time."""
+    stream = JsonStream(f)
+    for k in stream.keys():
+        if k != key:
+            stream.skip()
+        elif stream._peek() == '[':
+            for _ in stream.elements():
+                yield stream.value()
+            return
+        else:
+            for member_key in stream.keys():
+                yield member_key, stream.value()
+            return
+    raise KeyError(key)
+
+
+def load_json_members(f, keys):
+    """Dict of the given members of the top-level object of the json file
+    f, the other ones are skipped."""
+    stream = JsonStream(f)
+    members = dict()
+    for k in stream.keys():
+        if k in keys:
+            members[k] = stream.value()
+        else:
+            stream.skip()
+    return members
@@ -0,0 +1,138 @@
+"""
+Sparse block_number -> byte offset index for the Dune swap csv files.
+
+The index is an optional sidecar file, <csv file>.block_index.npy, with
+one (block_number, byte offset) row about every stride bytes of the csv
+file. Readers taking a from_block/to_block range use it to seek close to
+from_block instead of parsing the file from its start, and stop reading
+after to_block, so studying a small window of a large export only reads
+the bytes of that window. For compressed csv files (see compression.py)
+offsets refer to the decompressed data, and seeking decompresses the
+skipped data without parsing it.
+
+The csv file must be sorted by block_number, and block_number must come
+before any quoted column (as in all Dune exports used here).
+
+Usage:
+python -m src.csv_index data/dune_download/merged.csv
+"""
+
+import argparse
+import os
+from contextlib import contextmanager
+
+import numpy as np
+
+from .compression import open_file
+
+
+def block_index_filename(csv_filename):
+    return csv_filename + '.block_index.npy'
+
+
+def _block_column(header):
+    return header.decode().rstrip('\r\n').split(',').index('block_number')
+
+
+def build_block_index(csv_filename, stride=1 << 20):
+    """Index the first row of a block about every stride bytes."""
+    index = []
+    with open_file(csv_filename, 'rb') as f:
+        header = f.readline()
+        column = _block_column(header)
+        offset = len(header)
+        prev_block = None
+        last_indexed_offset = None
+        for line in f:
+            block = int(line.split(b',', column + 1)[column])
+            if prev_block is not None and block < prev_block:
+                raise ValueError(
+                    f"{csv_filename} is not sorted by block_number "
+                    f"(block {block} after block {prev_block})."
+                )
+            if block != prev_block and (
+                last_indexed_offset is None or offset - last_indexed_offset >= stride
+            ):
+                index.append((block, offset))
+                last_indexed_offset = offset
+            prev_block = block
+            offset += len(line)
+    index = np.array(index, dtype=np.int64).reshape(-1, 2)
+    np.save(block_index_filename(csv_filename), index)
+    return index
+
+
+def load_block_index(csv_filename):
+    """Return the index of a csv file, or None if it was not built."""
+    filename = block_index_filename(csv_filename)
+    if not os.path.exists(filename):
+        return None
+    if os.path.getmtime(filename) < os.path.getmtime(csv_filename):
+        print(f"Ignoring {filename}, which is older than {csv_filename}.")
+        return None
+    return np.load(filename)
+
+
+def _find_offset(csv_filename, from_block):
+    """Offset of an indexed row at or before the first row of from_block."""
+    index = load_block_index(csv_filename)
+    if index is None or len(index) == 0:
+        return None
+    # The last indexed row with a block strictly smaller than from_block
+    # precedes every row of from_block.
+    i = np.searchsorted(index[:, 0], from_block, side='left') - 1
+    return int(index[i, 1]) if i >= 0 else None
+
+
+def _iter_lines(header, f, column, from_block, to_block):
+    yield header.decode()
+    for line in f:
+        block = int(line.split(b',', column + 1)[column])
+        if from_block is not None and block < from_block:
+            continue
+        if to_block is not None and block > to_block:
+            break
+        yield line.decode()
+
+
+@contextmanager
+def open_block_range(csv_filename, from_block=None, to_block=None):
+    """Open a csv file as an iterator over its header and the lines of the
+    swaps with from_block <= block_number <= to_block.
+
+    Either bound can be None. The sidecar index is used if it exists.
+    """
+    if from_block is None and to_block is None:
+        with open_file(csv_filename, newline='') as f:
+            yield f
+        return
+    with open_file(csv_filename, 'rb') as f:
+        header = f.readline()
+        if from_block is not None:
+            offset = _find_offset(csv_filename, from_block)
+            if offset is not None:
+                f.seek(offset)
+        yield _iter_lines(header, f, _block_column(header), from_block, to_block)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Build the sparse block index of a Dune swap csv file.')
+
+    parser.add_argument(
+        'csv_file',
+        type=str,
+        help='Path to the csv file, sorted by block_number.'
+    )
+
+    parser.add_argument(
+        '--stride',
+        type=int,
+        default=1 << 20,
+        help='Approximate number of bytes between indexed rows.'
+    )
+
+    args = parser.parse_args()
+
+    index = build_block_index(args.csv_file, args.stride)
+    print(f"Indexed {len(index)} rows in {block_index_filename(args.csv_file)}")
@@ -0,0 +1,80 @@
+"""
+Streaming parser for the swap csv files exported from Dune.
+
+Dune exports array columns either in python-2 repr syntax, e.g.
+    [u'c02aaa39b223fe8d0a0e5c4f27ead9083c756cc2', u'8ab7404063ec4dbcfd4598215992dc3f8ec853d7']
+    [2990927096111926272, 191697124842787325129045L]
+or in postgres array syntax, e.g.
+    {"\\xc02aaa39b223fe8d0a0e5c4f27ead9083c756cc2","\\x8ab7404063ec4dbcfd4598215992dc3f8ec853d7"}
+    {2990927096111926272,191697124842787325129045}
+Both are parsed here with plain string operations instead of rewriting
+the cell and going through ast.literal_eval. Columns are located through
+the csv header, so the different query layouts can share this parser.
+"""
+
+import csv
+
+from .csv_index import open_block_range
+
+# Characters that are not part of an array element.
+_ARRAY_DELETE = str.maketrans('', '', '[]{}L \'"')
+_ADDRESS_ARRAY_DELETE = str.maketrans('', '', '[]{} \'"')
+
+
+def parse_int_array(cell):
+    cell = cell.translate(_ARRAY_DELETE)
+    if cell == '':
+        return []
+    return list(map(int, cell.split(',')))
+
+
+def parse_address_array(cell):
+    """Parse an array of addresses into a list of '0x' prefixed addresses."""
+    cell = cell.translate(_ADDRESS_ARRAY_DELETE)
+    if cell == '':
+        return []
+    # Addresses come as u'<hex>', "\\x<hex>" or 0x<hex>: the last 40
+    # characters are the address itself.
+    return ['0x' + a[-40:] for a in cell.split(',')]
+
+
+def parse_block_time(cell):
+    return int(float(cell))
+
+
+COLUMN_PARSERS = {
+    'block_number': int,
+    'index': int,
+    'gas_price': int,
+    'sell_amount': int,
+    'buy_amount': int,
+    'path': parse_address_array,
+    'output_amounts': parse_int_array,
+    'block_time': parse_block_time,
+}
+
+
+def iter_swaps(lines):
+    """Yield a dict per swap from an iterable of csv lines (header included)."""
+    reader = csv.reader(lines)
+    header = next(reader)
+    parsers = [COLUMN_PARSERS.get(name, str) for name in header]
+    for row in reader:
+        yield dict(zip(header, [parse(v) for parse, v in zip(parsers, row)]))
+
+
+def iter_swap_chunks(filename, chunk_size=10000, from_block=None, to_block=None):
+    """Yield lists of at most chunk_size parsed swaps from a Dune csv file.
+
+    If given, only swaps with from_block <= block_number <= to_block are
+    read (see csv_index.py).
+    """
+    with open_block_range(filename, from_block, to_block) as lines:
+        chunk = []
+        for swap in iter_swaps(lines):
+            chunk.append(swap)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if len(chunk) > 0:
+            yield chunk
@@ -1,9 +1,13 @@
+from . import interning
 from .download_swaps import get_swaps
-from .utils import is_there_a_opposite_match_in_next_k_blocks
+from .match_probability import waiting_time_histograms, waiting_time_cdf, expected_waiting_time, waiting_time_quantile
+from .swap_dataset import SwapDataset
+from .utils import pair_label
 
 # Parameters
 use_cache = True
 number_of_blocks_looking_forward = 50
+quantiles = [0.5, 0.9]
 focus_pairs = [['WETH', 'USDT', 'DAI', 'USDC'], ['WETH', 'DAI'],
                ['WETH', 'USDT'], ['WETH', 'USDC'], ['WETH', 'MKR'],
                ['WETH', 'GNO'], ['WETH', 'SUSHI'], ['WETH', 'SWRV'],
@@ -16,33 +20,26 @@ print("Expected waiting time for opposite offer in block:")
 # match - a counter order - for a random order
 # The calculation makes the assumption that the appearance of a counter order
 # is independent of placing the random order.
+# The distribution of the waiting time, for all waiting times up to
+# number_of_blocks_looking_forward, is computed in one pass over the blocks.
 
-swaps_by_block = get_swaps(use_cache, "data/uniswap_swaps.pickled")
+dataset = SwapDataset.from_swaps_by_block(
+    get_swaps(use_cache, "data/uniswap_swaps.pickled"))
+focus_pairs = [tuple(interning.tokens.intern(t) for t in focus_pair)
+               for focus_pair in focus_pairs]
 
-sorted_blocks = sorted(swaps_by_block.keys(), reverse=True)
-for focus_pair in focus_pairs:
-    prob_opposite_offer = []
-    for k in range(number_of_blocks_looking_forward):
-        nr_blocks_with_at_least_one_opposite_offer = 0
-        for i in range(len(sorted_blocks) - k):
-            if is_there_a_opposite_match_in_next_k_blocks(i,
-                                                          k,
-                                                          focus_pair,
-                                                          swaps_by_block,
-                                                          sorted_blocks):
-                nr_blocks_with_at_least_one_opposite_offer += 1
+hist = waiting_time_histograms(dataset, focus_pairs, number_of_blocks_looking_forward)
+prob_opposite_offer = waiting_time_cdf(hist)
+expected_waiting_time_for_user = expected_waiting_time(hist)
+waiting_time_quantiles = [waiting_time_quantile(hist, q) for q in quantiles]
 
-        prob_opposite_offer.append(nr_blocks_with_at_least_one_opposite_offer /
-                                   (len(sorted_blocks) - k))
-
-    expected_waiting_time_for_user = 0
-    last_probability = 0
-    for k, v in enumerate(prob_opposite_offer, 1):
-        expected_waiting_time_for_user += k*(v-last_probability)
-        last_probability = v
-    print(focus_pair)
-    if last_probability > 0.98:
-        print(expected_waiting_time_for_user)
+for i, focus_pair in enumerate(focus_pairs):
+    print(pair_label(focus_pair))
+    if prob_opposite_offer[i, -1] > 0.98:
+        print(expected_waiting_time_for_user[i])
     else:
         print("Increase number_of_blocks_looking_forward to get"
               "a reasonable calculation")
+    for q, quantile in zip(quantiles, waiting_time_quantiles):
+        if quantile[i] >= 0:
+            print(f"{q:.0%} of the orders wait at most {quantile[i]} blocks")
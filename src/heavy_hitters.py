@@ -0,0 +1,255 @@
+"""
+Arbitrageur detection with bounded memory, in a single streaming pass.
+
+utils.filter_out_arbitrageur_swaps and make_instances.get_users_sorted_by_incr_nr_swaps
+count the orders of every address over the whole dataset before anything
+can be filtered. Here the frequent addresses are tracked with the
+SpaceSaving summary (Metwally et al.), which keeps capacity counters: an
+address that is not tracked replaces the one with the smallest count and
+inherits it. For n counted orders:
+
+- every address with more than n / capacity orders is tracked,
+- the count of a tracked address overestimates its true count by at most
+  its error, itself at most n / capacity.
+
+So flagging the addresses whose count is above max_amount_swaps_retail_traders
+finds every arbitrageur as long as n / capacity <= max_amount_swaps_retail_traders.
+Overestimated counts can flag a few retail traders too, lower_bound tells
+which addresses are above the threshold for sure, and compare_with_exact
+counts the differences with exact counts.
+
+SlidingHeavyHitters counts the orders of the last blocks only, with one
+summary per pane of consecutive blocks, so that the filter also works on
+a live feed (see streaming_match_probability.py).
+
+Usage, comparing with the exact counts over a swap store:
+python -m src.heavy_hitters data/dune_download/merged_store --capacity 10000
+"""
+
+import argparse
+import heapq
+from collections import deque
+
+import numpy as np
+
+from .chunked_match_probability import count_orders_by_address, iter_address_order_counts
+from .swap_dataset import arbitrageur_mask
+from .swap_store import SwapStore
+
+
+class SpaceSaving:
+    """Approximate counts of the capacity most frequent items."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = dict()
+        self.errors = dict()
+        # (count, item) of every tracked item, plus outdated entries that
+        # are skipped when found at the top.
+        self.heap = []
+        self.nr_counted = 0
+
+    def _min(self):
+        while True:
+            count, item = self.heap[0]
+            if self.counts.get(item) == count:
+                return count, item
+            heapq.heappop(self.heap)
+
+    def add(self, item, count=1):
+        self.nr_counted += count
+        if item in self.counts:
+            self.counts[item] += count
+        elif len(self.counts) < self.capacity:
+            self.counts[item] = count
+            self.errors[item] = 0
+        else:
+            min_count, min_item = self._min()
+            heapq.heappop(self.heap)
+            del self.counts[min_item]
+            del self.errors[min_item]
+            self.counts[item] = min_count + count
+            self.errors[item] = min_count
+        heapq.heappush(self.heap, (self.counts[item], item))
+        if len(self.heap) > 4 * self.capacity:
+            self.heap = [(c, i) for i, c in self.counts.items()]
+            heapq.heapify(self.heap)
+
+    def min_count(self):
+        """Upper bound of the count of any item that is not tracked."""
+        if len(self.counts) < self.capacity:
+            return 0
+        return self._min()[0]
+
+    def estimate(self, item):
+        """Upper bound of the count of item."""
+        return self.counts.get(item, self.min_count())
+
+    def lower_bound(self, item):
+        return self.counts[item] - self.errors[item] if item in self.counts else 0
+
+    def heavy_hitters(self, threshold):
+        """Tracked items counted more than threshold times."""
+        return {item for item, count in self.counts.items() if count > threshold}
+
+    def most_common(self, n):
+        return sorted(self.counts.items(), key=lambda c: -c[1])[:n]
+
+
+class SlidingHeavyHitters:
+    """SpaceSaving over the orders of the last window_nr_blocks blocks.
+
+    The window is split into nr_panes panes of consecutive blocks, with a
+    summary each; the summary of a pane is dropped once all its blocks
+    left the window. Counts are over whole panes, so they can include up
+    to window_nr_blocks / nr_panes blocks older than the window. Memory
+    is nr_panes + 1 summaries. If window_nr_blocks is None, all the
+    blocks are counted in a single summary.
+
+    Items are flagged on the lower bound of their count: an address is
+    only flagged once the orders counted for sure exceed the threshold,
+    so a count overestimated by the panes never flags an address with at
+    most threshold orders in them. An arbitrageur is flagged as long as
+    its error, at most the sum of the min_count of the panes, leaves it
+    above the threshold.
+    """
+
+    def __init__(self, window_nr_blocks, capacity, nr_panes=10):
+        self.window_nr_blocks = window_nr_blocks
+        self.capacity = capacity
+        self.pane_nr_blocks = None if window_nr_blocks is None else \
+            max(-(-window_nr_blocks // nr_panes), 1)
+        # (first block of the pane, summary of its orders)
+        self.panes = deque()
+
+    def add_block(self, block_number, items):
+        if self.pane_nr_blocks is None:
+            pane_start = 0
+        else:
+            pane_start = block_number - block_number % self.pane_nr_blocks
+        if not self.panes or self.panes[-1][0] != pane_start:
+            self.panes.append((pane_start, SpaceSaving(self.capacity)))
+        if self.pane_nr_blocks is not None:
+            first_block = block_number - self.window_nr_blocks + 1
+            while self.panes[0][0] + self.pane_nr_blocks <= first_block:
+                self.panes.popleft()
+        summary = self.panes[-1][1]
+        for item in items:
+            summary.add(item)
+
+    def estimate(self, item):
+        """Upper bound of the count of item in the window.
+
+        A pane that does not track item adds its min_count, since item may
+        have been evicted from it, so the bound loosens with the number of
+        panes; see bounds."""
+        return sum(summary.estimate(item) for _, summary in self.panes)
+
+    def lower_bound(self, item):
+        """Number of orders of item that every pane counted for sure."""
+        return sum(summary.lower_bound(item) for _, summary in self.panes)
+
+    def bounds(self, item):
+        """(lower bound, upper bound) of the count of item in the window."""
+        return self.lower_bound(item), self.estimate(item)
+
+    def is_heavy_hitter(self, item, threshold):
+        """Whether item is counted more than threshold times for sure, so
+        that the over-estimates of the panes never flag an item."""
+        return self.lower_bound(item) > threshold
+
+    def heavy_hitters(self, threshold):
+        candidates = set().union(*(summary.counts for _, summary in self.panes))
+        return {item for item in candidates if self.is_heavy_hitter(item, threshold)}
+
+
+def store_heavy_hitters(store, capacity, split=True, data_usage_percentage=100, seed=0,
+                        from_block=None, to_block=None, chunk_size=1000000):
+    """SpaceSaving summary of the orders of every address (by shared
+    interning id) that SwapDataset.from_store would load with the same
+    arguments, counted in a single pass over the store columns."""
+    summary = SpaceSaving(capacity)
+    for addresses, nr_orders in iter_address_order_counts(
+            store, split, data_usage_percentage, seed, from_block, to_block, chunk_size):
+        # consecutive orders of the same address are counted at once
+        if len(addresses) == 0:
+            continue
+        run_starts = np.flatnonzero(np.diff(addresses, prepend=addresses[0] - 1))
+        run_counts = np.add.reduceat(nr_orders, run_starts)
+        for address, count in zip(addresses[run_starts].tolist(), run_counts.tolist()):
+            if count > 0:
+                summary.add(address, count)
+    return summary
+
+
+def sketch_arbitrageurs(store, capacity, split=True, data_usage_percentage=100, seed=0,
+                        from_block=None, to_block=None, max_amount_swaps_retail_traders=50):
+    """Same as chunked_match_probability.store_arbitrageurs, with a
+    summary of capacity addresses instead of a counter per address."""
+    summary = store_heavy_hitters(
+        store, capacity, split, data_usage_percentage, seed, from_block, to_block)
+    return np.array(sorted(summary.heavy_hitters(max_amount_swaps_retail_traders)), dtype=np.int64)
+
+
+def compare_with_exact(flagged, counts, max_amount_swaps_retail_traders=50):
+    """(false positives, false negatives) of the flagged address ids,
+    given the exact number of orders of every address id."""
+    exact = set(np.flatnonzero(arbitrageur_mask(counts, max_amount_swaps_retail_traders)).tolist())
+    return flagged - exact, exact - flagged
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Compare the arbitrageurs found with a SpaceSaving summary to the exact ones.')
+
+    parser.add_argument(
+        'store',
+        type=str,
+        help="Swap store directory."
+    )
+    parser.add_argument(
+        '--capacity',
+        type=int,
+        default=10000,
+        help="Number of addresses tracked by the summary."
+    )
+    parser.add_argument(
+        '--max_amount_swaps_retail_traders',
+        type=int,
+        default=50,
+        help="Addresses with more orders are arbitrageurs."
+    )
+    parser.add_argument(
+        '--data_usage_percentage',
+        type=float,
+        default=100,
+        help="Percentage of the swaps migrating from uniswap."
+    )
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=0,
+        help="Selects which swaps are sampled as migrating."
+    )
+    parser.add_argument(
+        '--whole_swaps',
+        action='store_true',
+        help="Do not split swaps into one order per hop."
+    )
+
+    args = parser.parse_args()
+
+    store = SwapStore(args.store)
+    split = not args.whole_swaps
+    summary = store_heavy_hitters(
+        store, args.capacity, split, args.data_usage_percentage, args.seed)
+    flagged = summary.heavy_hitters(args.max_amount_swaps_retail_traders)
+    counts = count_orders_by_address(store, split, args.data_usage_percentage, args.seed)
+    false_positives, false_negatives = compare_with_exact(
+        flagged, counts, args.max_amount_swaps_retail_traders)
+    print("Orders:", summary.nr_counted, ", addresses:", np.count_nonzero(counts),
+          ", tracked by the summary:", len(summary.counts))
+    print("Maximum overestimation of a count:", summary.min_count())
+    print("Arbitrageurs found with the summary:", len(flagged),
+          ", exactly:", len(flagged) - len(false_positives) + len(false_negatives))
+    print("False positives:", len(false_positives), ", false negatives:", len(false_negatives))
@@ -0,0 +1,246 @@
+"""
+Persisted, incrementally updated results of probability_of_match.py.
+
+Results are kept in a directory as sufficient statistics: for every pair,
+the number of windows of each waiting time that contain a counter order
+(the number of windows is the same for all pairs), together with the
+block range and the parameters they were computed with, the number of
+orders of every address and the pairs seen in the range. When the swap
+store has been extended with new blocks, only the new windows are
+counted, which reads the new blocks plus the max(waiting_times) - 1
+blocks before them, so a rerun costs time proportional to the new data.
+
+The statistics are computed again from scratch if the parameters or the
+first block change. If the new blocks change the arbitrageurs, their
+orders must be removed from (or added back to) the old blocks too: only
+the pairs of these orders are counted again over the old blocks.
+
+Files:
+    meta.json   parameters, block range and arbitrageurs of the statistics
+    stats.npz   pairs (as token addresses), hit counts, orders per address,
+                and the focus pairs seen inside the range and in its last block
+"""
+
+import json
+import os
+
+import numpy as np
+
+from . import interning
+from .chunked_match_probability import address_directions, chunked_hit_counts, count_orders_by_address, \
+    iter_chunks
+from .match_probability import count_hit_windows, counter_occurrences
+from .swap_dataset import arbitrageur_mask
+
+
+def _labels(ids, values):
+    return np.array([values[i] for i in np.ravel(ids)], dtype=str).reshape(np.shape(ids))
+
+
+def _pair_labels(pairs):
+    return _labels(np.asarray(pairs, dtype=np.int64).reshape(-1, 2), interning.tokens)
+
+
+def _pair_ids(labels):
+    return [tuple(interning.tokens.intern(t) for t in p) for p in labels.tolist()]
+
+
+def _directions(dataset, first_position, stop_position):
+    """(sell token, buy token) of the orders in a range of positions."""
+    def clip(position):
+        return min(max(position, 0), dataset.nr_blocks)
+    rows = slice(dataset.block_offsets[clip(first_position)],
+                 dataset.block_offsets[clip(stop_position)])
+    return np.stack([dataset.sell_token[rows], dataset.buy_token[rows]], axis=1)
+
+
+def _unique_pairs(pairs):
+    return np.unique(np.concatenate(pairs).reshape(-1, 2), axis=0)
+
+
+def load_statistics(results_dir):
+    """Return (meta, stats), or None if there are no saved statistics."""
+    meta_filename = os.path.join(results_dir, 'meta.json')
+    if not os.path.exists(meta_filename):
+        return None
+    with open(meta_filename, 'r') as f:
+        meta = json.load(f)
+    with np.load(os.path.join(results_dir, 'stats.npz')) as stats:
+        return meta, dict(stats)
+
+
+def save_statistics(results_dir, meta, stats):
+    os.makedirs(results_dir, exist_ok=True)
+    np.savez(os.path.join(results_dir, 'stats.npz'), **stats)
+    with open(os.path.join(results_dir, 'meta.json'), 'w+') as f:
+        json.dump(meta, f)
+
+
+def _update_changed_pairs(store, hits_by_pair, inner_pairs, last_block_pairs,
+                          changed_addresses, arbitrageurs, waiting_times, chunk_nr_blocks,
+                          split, data_usage_percentage, seed, last_block):
+    """Update the statistics of the blocks up to last_block to a new set of
+    arbitrageurs, where changed_addresses became or stopped being ones.
+
+    Only the pairs of the orders of these addresses can change: their hits
+    (as counter orders) are counted again and replaced in hits_by_pair,
+    and whether they are focus pairs inside the range or in its last
+    block is found in the same pass. Returns the updated (inner_pairs,
+    last_block_pairs).
+    """
+    directions = address_directions(
+        store, changed_addresses, split, data_usage_percentage, seed, to_block=last_block)
+    if len(directions) == 0:
+        return inner_pairs, last_block_pairs
+    nr_blocks = last_block - int(store.block[0]) + 1
+    # the orders of a direction (A, B) are the counter orders of (B, A)
+    focus_pairs = [tuple(p) for p in directions[:, ::-1].tolist()]
+    hits = np.zeros((len(focus_pairs), len(waiting_times)), dtype=np.int64)
+    inner = np.zeros(len(focus_pairs), dtype=bool)
+    last = np.zeros(len(focus_pairs), dtype=bool)
+    for start, dataset in iter_chunks(
+            store, chunk_nr_blocks, max(waiting_times) - 1, split, data_usage_percentage,
+            seed, to_block=last_block, arbitrageurs=arbitrageurs):
+        pair, position = counter_occurrences(dataset, focus_pairs)
+        for j, k in enumerate(waiting_times):
+            first_start = max(1, start)
+            last_start = min(start + chunk_nr_blocks, nr_blocks - k + 1)
+            if first_start < last_start:
+                hits[:, j] += count_hit_windows(
+                    pair, position, len(focus_pairs), k,
+                    first_start - start, last_start - start)
+        position = position + start
+        inner[pair[(position >= 1) & (position < nr_blocks - 1)]] = True
+        last[pair[position == nr_blocks - 1]] = True
+
+    for label, h in zip(map(tuple, _pair_labels(focus_pairs).tolist()), hits):
+        hits_by_pair[label] = h
+    labels = _pair_labels(directions)
+    changed = set(map(tuple, labels.tolist()))
+
+    def update(pairs, present):
+        kept = {p for p in map(tuple, pairs.reshape(-1, 2).tolist()) if p not in changed}
+        pairs = sorted(kept | set(map(tuple, labels[present].tolist())))
+        return np.array(pairs, dtype=str).reshape(-1, 2)
+
+    return update(inner_pairs, inner), update(last_block_pairs, last)
+
+
+def update_match_statistics(store, results_dir, waiting_times, split=True,
+                            data_usage_percentage=100, seed=0,
+                            max_amount_swaps_retail_traders=50,
+                            fraction_to_remove=None, chunk_nr_blocks=100000):
+    """Update the statistics saved in results_dir to the blocks of store.
+
+    Returns (focus_pairs, probabilities), the same as loading the whole
+    store in a SwapDataset, filtering out arbitrageurs and calling
+    match_probabilities with its focus pairs. The store is read
+    chunk_nr_blocks blocks at a time, or all at once if None.
+    """
+    first_block, last_block = int(store.block[0]), int(store.block[-1])
+    nr_blocks = last_block - first_block + 1
+    if chunk_nr_blocks is None:
+        chunk_nr_blocks = nr_blocks
+    params = {
+        'split': split,
+        'data_usage_percentage': data_usage_percentage,
+        'seed': seed,
+        'max_amount_swaps_retail_traders': max_amount_swaps_retail_traders,
+        'fraction_to_remove': fraction_to_remove,
+        'waiting_times': list(waiting_times),
+    }
+    previous = load_statistics(results_dir)
+    if previous is not None:
+        meta, stats = previous
+        if meta['params'] != params or meta['first_block'] != first_block \
+           or meta['last_block'] > last_block:
+            print("The parameters or the block range changed, computing all statistics.")
+            previous = None
+
+    # orders per address, counting the new blocks only
+    if previous is not None:
+        old_address_ids = interning.addresses.intern_array(stats['addresses'])
+        counts = count_orders_by_address(
+            store, split, data_usage_percentage, seed, meta['last_block'] + 1)
+        counts[old_address_ids] += stats['address_counts']
+    else:
+        counts = count_orders_by_address(store, split, data_usage_percentage, seed)
+    arbitrageurs = np.flatnonzero(arbitrageur_mask(
+        counts, max_amount_swaps_retail_traders, fraction_to_remove))
+    arbitrageur_labels = sorted(_labels(arbitrageurs, interning.addresses).tolist())
+    if previous is not None:
+        old_nr_blocks = meta['last_block'] - first_block + 1
+        hits_by_pair = dict(zip(map(tuple, stats['pairs'].tolist()), stats['hits']))
+        old_inner_pairs, last_block_pairs = stats['inner_pairs'], stats['last_block_pairs']
+        changed = sorted(set(meta['arbitrageurs']) ^ set(arbitrageur_labels))
+        if len(changed) > 0:
+            print(f"The new blocks changed {len(changed)} arbitrageurs, "
+                  "counting the pairs of their orders again.")
+            old_inner_pairs, last_block_pairs = _update_changed_pairs(
+                store, hits_by_pair, old_inner_pairs, last_block_pairs,
+                [interning.addresses.intern(a) for a in changed], arbitrageurs,
+                waiting_times, chunk_nr_blocks, split, data_usage_percentage, seed,
+                meta['last_block'])
+        inner_pairs = [old_inner_pairs]
+        if nr_blocks > old_nr_blocks:
+            # the old last block is not the last one anymore
+            inner_pairs.append(last_block_pairs)
+        # windows starting from here are new
+        first_starts = [old_nr_blocks - k + 1 for k in waiting_times]
+        first_new_position = old_nr_blocks
+    else:
+        hits_by_pair = dict()
+        inner_pairs = []
+        first_starts = [1] * len(waiting_times)
+        first_new_position = 0
+
+    if nr_blocks > first_new_position:
+        # Pairs with a counter order in the blocks read, and focus pairs
+        # in the new blocks. As in SwapDataset.focus_pairs, the first and
+        # the last block of the axis are ignored.
+        counter_pairs = []
+        new_inner_pairs = []
+        last_block_pairs = []
+        for start, dataset in iter_chunks(
+                store, chunk_nr_blocks, 0, split, data_usage_percentage, seed,
+                arbitrageurs=arbitrageurs, first_position=max(0, min(first_starts))):
+            counter_pairs.append(_directions(dataset, 0, dataset.nr_blocks)[:, ::-1])
+            new_inner_pairs.append(_directions(
+                dataset, max(first_new_position, 1) - start, nr_blocks - 1 - start))
+            last_block_pairs.append(_directions(
+                dataset, nr_blocks - 1 - start, nr_blocks - start))
+        counter_pairs = _unique_pairs(counter_pairs)
+        inner_pairs.append(_pair_labels(_unique_pairs(new_inner_pairs)))
+        last_block_pairs = _pair_labels(_unique_pairs(last_block_pairs))
+
+        hits = chunked_hit_counts(
+            store, [tuple(p) for p in counter_pairs.tolist()], waiting_times,
+            chunk_nr_blocks, split, data_usage_percentage, seed,
+            arbitrageurs=arbitrageurs, first_starts=first_starts)
+        for label, h in zip(map(tuple, _pair_labels(counter_pairs).tolist()), hits):
+            hits_by_pair[label] = hits_by_pair.get(label, 0) + h
+
+    inner_pairs = np.unique(np.concatenate(inner_pairs).reshape(-1, 2), axis=0)
+    address_ids = np.flatnonzero(counts)
+    pairs = sorted(hits_by_pair)
+    save_statistics(results_dir, {
+        'params': params,
+        'first_block': first_block,
+        'last_block': last_block,
+        'arbitrageurs': arbitrageur_labels,
+    }, {
+        'pairs': np.array(pairs, dtype=str).reshape(-1, 2),
+        'hits': np.array([hits_by_pair[p] for p in pairs], dtype=np.int64).reshape(-1, len(waiting_times)),
+        'addresses': _labels(address_ids, interning.addresses),
+        'address_counts': counts[address_ids],
+        'inner_pairs': inner_pairs,
+        'last_block_pairs': last_block_pairs,
+    })
+
+    focus_pairs = sorted(_pair_ids(inner_pairs))
+    no_hits = np.zeros(len(waiting_times), dtype=np.int64)
+    hits = np.array([
+        hits_by_pair.get(tuple(interning.tokens[t] for t in p), no_hits)
+        for p in focus_pairs
+    ], dtype=np.int64).reshape(-1, len(waiting_times))
+    return focus_pairs, hits / (nr_blocks - np.asarray(waiting_times))
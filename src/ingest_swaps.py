@@ -0,0 +1,194 @@
+"""
+Ingests a directory of Dune swap exports (one csv per block range) into a
+single swap store, ordered by (block_number, index).
+
+Every file is parsed in a worker process into a temporary store, and the
+temporary stores are then k-way merged into the output store in a single
+streaming pass, so no merged csv file is ever written. Overlapping block
+ranges between files are reported, and swaps present in more than one
+file are only stored once.
+
+Usage:
+python -m src.ingest_swaps data/dune_download data/dune_download/merged_store
+"""
+
+import argparse
+import glob
+import heapq
+import os
+import tempfile
+from multiprocessing import Pool
+
+from .csv_index import block_index_filename
+from .dune_csv import iter_swap_chunks
+from .swap_store import SwapStore, SwapStoreWriter
+
+
+def _swap_row(swap):
+    return (swap['block_number'], swap['index'], swap['address'], swap['path'],
+            swap['output_amounts'], swap.get('block_time'))
+
+
+def _write_in_order(csv_filename, writer):
+    """Append the swaps of a csv file to writer as they are parsed.
+    Returns (nr_swaps, first_block, last_block), or None as soon as a swap
+    comes before the previous one in (block_number, index) order."""
+    nr_swaps, first, previous = 0, None, None
+    for chunk in iter_swap_chunks(csv_filename):
+        for swap in chunk:
+            key = (swap['block_number'], swap['index'])
+            if previous is not None and key < previous:
+                return None
+            writer.append(*_swap_row(swap))
+            nr_swaps += 1
+            first = key if first is None else first
+            previous = key
+    if nr_swaps == 0:
+        return 0, None, None
+    return nr_swaps, first[0], previous[0]
+
+
+def parse_to_store(csv_filename, store_dir):
+    """Parse a csv file into a store sorted by (block_number, index).
+
+    Dune exports are expected to be sorted already, so swaps are written
+    to the store while they are parsed, without holding the file in
+    memory. A file that turns out not to be sorted is parsed again, and
+    sorted in memory.
+    """
+    with SwapStoreWriter(store_dir) as writer:
+        parsed = _write_in_order(csv_filename, writer)
+    if parsed is not None:
+        return (csv_filename, store_dir) + parsed
+
+    print(f"Warning: {csv_filename} is not sorted by block, sorting it in memory.")
+    swaps = [_swap_row(s) for chunk in iter_swap_chunks(csv_filename) for s in chunk]
+    swaps.sort(key=lambda s: (s[0], s[1]))
+    with SwapStoreWriter(store_dir) as writer:
+        for swap in swaps:
+            writer.append(*swap)
+    first_block = swaps[0][0] if len(swaps) > 0 else None
+    last_block = swaps[-1][0] if len(swaps) > 0 else None
+    return csv_filename, store_dir, len(swaps), first_block, last_block
+
+
+def _parse_to_store(args):
+    return parse_to_store(*args)
+
+
+def iter_store_swaps(store_dir, source, chunk_size=100000):
+    """Yield (block_number, index, source, address, path, output_amounts,
+    block_time) for every swap in a store."""
+    store = SwapStore(store_dir)
+    tokens = store.tokens.values
+    addresses = store.addresses.values
+    for start in range(0, len(store), chunk_size):
+        end = min(start + chunk_size, len(store))
+        blocks = store.block[start:end].tolist()
+        indexes = store.index[start:end].tolist()
+        address_ids = store.address[start:end].tolist()
+        hop_offsets = store.hop_offsets[start:end + 1].tolist()
+        hop_tokens = store.hop_tokens[hop_offsets[0]:hop_offsets[-1]].tolist()
+        amounts = store.amounts[hop_offsets[0]:hop_offsets[-1]].to_ints()
+        block_times = store.block_time[start:end].tolist()
+        first_hop = hop_offsets[0]
+        for i in range(end - start):
+            hops = slice(hop_offsets[i] - first_hop, hop_offsets[i + 1] - first_hop)
+            yield (blocks[i], indexes[i], source, addresses[address_ids[i]],
+                   [tokens[t] for t in hop_tokens[hops]], amounts[hops],
+                   block_times[i] if block_times[i] >= 0 else None)
+
+
+def find_overlapping_ranges(parsed_files):
+    """Return (range, overlapped range) for files whose block ranges overlap.
+
+    Ranges are (first_block, last_block, csv_filename) tuples.
+    """
+    ranges = sorted(
+        (first_block, last_block, csv_filename)
+        for csv_filename, _, nr_swaps, first_block, last_block in parsed_files
+        if nr_swaps > 0
+    )
+    overlaps = []
+    furthest = None  # range reaching the highest block so far
+    for r in ranges:
+        if furthest is not None and r[0] <= furthest[1]:
+            overlaps.append((furthest, r))
+        if furthest is None or r[1] > furthest[1]:
+            furthest = r
+    return overlaps
+
+
+def ingest(csv_filenames, store_dir, nr_processes=None):
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(store_dir))) as tmp_dir:
+        jobs = [
+            (csv_filename, os.path.join(tmp_dir, str(i)))
+            for i, csv_filename in enumerate(csv_filenames)
+        ]
+        with Pool(nr_processes) as pool:
+            parsed_files = pool.map(_parse_to_store, jobs)
+
+        for (f1, l1, name1), (f2, l2, name2) in find_overlapping_ranges(parsed_files):
+            print(f"Warning: {name1} ({f1}-{l1}) overlaps {name2} ({f2}-{l2}) "
+                  f"on blocks {f2}-{min(l1, l2)}.")
+
+        nr_duplicates = 0
+        prev = None
+        merged = heapq.merge(*[
+            iter_store_swaps(tmp_store_dir, source)
+            for source, (_, tmp_store_dir, _, _, _) in enumerate(parsed_files)
+        ])
+        with SwapStoreWriter(store_dir) as writer:
+            for block_number, index, source, address, path, output_amounts, block_time in merged:
+                # The same swap exported in two overlapping files is only
+                # kept once. Repeated (block, index) entries within a file
+                # are kept as they are.
+                if prev is not None and prev[:2] == (block_number, index) \
+                   and prev[2] != source:
+                    nr_duplicates += 1
+                    continue
+                writer.append(block_number, index, address, path, output_amounts, block_time)
+                prev = (block_number, index, source)
+    if nr_duplicates > 0:
+        print(f"Warning: skipped {nr_duplicates} swaps present in more than one file.")
+    return SwapStore(store_dir)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Merge a directory of Dune swap csv exports into a swap store.')
+
+    parser.add_argument(
+        'input_dir',
+        type=str,
+        help='Directory with the Dune csv exports.'
+    )
+
+    parser.add_argument(
+        'store_dir',
+        type=str,
+        help='Path to output store directory.'
+    )
+
+    parser.add_argument(
+        '--pattern',
+        type=str,
+        default='*swaps*.csv*',
+        help='Glob pattern selecting the (possibly compressed) csv files in input_dir.'
+    )
+
+    parser.add_argument(
+        '--nr_processes',
+        type=int,
+        default=None,
+        help='Number of parsing processes. Defaults to the number of cpus.'
+    )
+
+    args = parser.parse_args()
+
+    csv_filenames = sorted(
+        f for f in glob.glob(os.path.join(args.input_dir, args.pattern))
+        if not f.endswith(block_index_filename(''))
+    )
+    store = ingest(csv_filenames, args.store_dir, args.nr_processes)
+    print(f"Stored {len(store)} swaps from {len(csv_filenames)} files in {args.store_dir}")
@@ -0,0 +1,51 @@
+"""
+Registries mapping token and trader addresses to dense integer ids.
+
+Comparing 42 character hex strings in the inner loops of the matching code
+is slow, and so is storing them per swap. Loaders intern every address once
+into one of the shared registries below, and the analysis code works on the
+resulting ids. The original address is recovered with registry[id] when
+reporting.
+"""
+
+import numpy as np
+
+
+class Interner:
+    """Assigns consecutive ids, starting at 0, to the values it is given."""
+
+    def __init__(self, values=()):
+        self.ids = {}
+        self.values = []
+        for value in values:
+            self.intern(value)
+
+    def intern(self, value):
+        i = self.ids.get(value)
+        if i is None:
+            i = self.ids[value] = len(self.values)
+            self.values.append(value)
+        return i
+
+    def intern_array(self, values):
+        return np.fromiter(
+            (self.intern(v) for v in values), dtype=np.int32, count=len(values)
+        )
+
+    def id(self, value):
+        """Id of an already interned value. Raises KeyError otherwise."""
+        return self.ids[value]
+
+    def __getitem__(self, i):
+        return self.values[i]
+
+    def __contains__(self, value):
+        return value in self.ids
+
+    def __len__(self):
+        return len(self.values)
+
+
+# Shared registries for the analysis layer.
+tokens = Interner()
+addresses = Interner()
@@ -0,0 +1,387 @@
+"""
+Vectorized computation of the probability of finding a counter order.
+
+For every focus pair, the blocks of a SwapDataset containing a counter
+order of the pair (an order buying focus_pair[0] and selling one of
+focus_pair[1:4], as in utils.find_order_in_block) are found with a single
+join of all orders against all focus pairs. Instead of a dense
+pairs x blocks presence bitmap, the presence of every pair is kept as the
+sorted list of block positions where it is set, and the number of windows
+of k blocks containing a counter order is computed from the distances
+between consecutive positions, i.e. from the prefix sums of the bitmap at
+the positions where they change. This is O(counter orders) per k, for all
+pairs at once, instead of O(pairs x blocks x k x orders per block).
+
+Windows can also be given in seconds (time_match_probabilities), like the
+batch_duration of make_instances. Block timestamps are sorted, so the
+first block of the window of every counter order is found by binary
+search.
+
+volume_match_probabilities weights orders by their volume, and counts
+the fraction of it that the volume of the counter orders could match.
+
+For very large runs, sampled_match_probabilities estimates the
+probabilities from a stratified sample of blocks, which grows until the
+confidence interval of every pair is narrow enough.
+"""
+
+from statistics import NormalDist
+
+import numpy as np
+
+
+def _ranges(lo, hi):
+    """Concatenation of the ranges lo[i]:hi[i]."""
+    counts = hi - lo
+    return np.repeat(lo - (np.cumsum(counts) - counts), counts) + np.arange(counts.sum())
+
+
+def _counter_combos(dataset, focus_pairs):
+    """(nr_tokens, combo_pair, combo_code): the (sell token, buy token)
+    codes sell_token * nr_tokens + buy_token of the counter orders of
+    every focus pair, and the index of the focus pair of every code."""
+    nr_tokens = int(max(
+        dataset.sell_token.max(initial=0), dataset.buy_token.max(initial=0),
+        max((max(p) for p in focus_pairs), default=0)
+    )) + 1
+    # A counter order of focus_pair sells one of focus_pair[1:4] and buys
+    # focus_pair[0].
+    combo_pair = np.array(
+        [i for i, p in enumerate(focus_pairs) for _ in p[1:4]], dtype=np.int64)
+    combo_code = np.array(
+        [t * nr_tokens + p[0] for p in focus_pairs for t in p[1:4]], dtype=np.int64)
+    return nr_tokens, combo_pair, combo_code
+
+
+def _counter_orders(dataset, focus_pairs):
+    """Counter orders of every focus pair, as the arrays (pair, rows) of
+    the index of the focus pair and the row of the order in the dataset."""
+    nr_tokens, combo_pair, combo_code = _counter_combos(dataset, focus_pairs)
+    order_code = dataset.sell_token.astype(np.int64) * nr_tokens + dataset.buy_token
+    by_code = np.argsort(order_code, kind='stable')
+    sorted_code = order_code[by_code]
+    lo = np.searchsorted(sorted_code, combo_code, side='left')
+    hi = np.searchsorted(sorted_code, combo_code, side='right')
+    # orders matching every combo, concatenated
+    rows = by_code[_ranges(lo, hi)]
+    return np.repeat(combo_pair, hi - lo), rows
+
+
+def counter_occurrences(dataset, focus_pairs):
+    """Block positions with a counter order of every focus pair.
+
+    Returns the arrays (pair, position): pair is the index of the focus
+    pair in focus_pairs, and there is one entry per block of the axis
+    containing a counter order of the pair, sorted by pair and position.
+    """
+    pair, rows = _counter_orders(dataset, focus_pairs)
+    keys = np.unique(pair * dataset.nr_blocks + dataset.block_positions[rows])
+    return keys // dataset.nr_blocks, keys % dataset.nr_blocks
+
+
+def _count_hits(pair, position, window_lo, nr_pairs, first_start, last_start):
+    """Number of windows with a start s, first_start <= s < last_start,
+    that contain a position of each pair, where window_lo[j] is the
+    smallest start of a window containing position[j]."""
+    # The windows containing position o, and no previous position p of
+    # the same pair, start in (max(p, window_lo - 1), o].
+    same_pair = np.zeros(len(pair), dtype=bool)
+    same_pair[1:] = pair[1:] == pair[:-1]
+    previous = np.where(same_pair, np.roll(position, 1), np.iinfo(np.int64).min // 2)
+    lo = np.maximum(np.maximum(previous + 1, window_lo), first_start)
+    hi = np.minimum(position, last_start - 1)
+    return np.bincount(
+        pair, weights=np.maximum(hi - lo + 1, 0), minlength=nr_pairs
+    ).astype(np.int64)
+
+
+def count_hit_windows(pair, position, nr_pairs, k, first_start, last_start):
+    """Number of windows [s, s + k), first_start <= s < last_start, that
+    contain a position of each pair.
+
+    pair and position are sorted as returned by counter_occurrences.
+    """
+    return _count_hits(pair, position, position - k + 1, nr_pairs, first_start, last_start)
+
+
+def match_probabilities(dataset, focus_pairs, waiting_times):
+    """Probability that a counter order of each focus pair is found in the
+    waiting_time blocks following a block, for every waiting time.
+
+    Returns an array of shape (len(focus_pairs), len(waiting_times)).
+    Orders are placed at the blocks 0 .. nr_blocks - waiting_time - 1 of
+    the axis, so that their following blocks are all in the dataset.
+    """
+    pair, position = counter_occurrences(dataset, focus_pairs)
+    probabilities = np.zeros((len(focus_pairs), len(waiting_times)))
+    for j, k in enumerate(waiting_times):
+        nr_orders = dataset.nr_blocks - k
+        hits = count_hit_windows(pair, position, len(focus_pairs), k, 1, nr_orders + 1)
+        probabilities[:, j] = hits / nr_orders
+    return probabilities
+
+
+def time_match_probabilities(dataset, focus_pairs, waiting_seconds):
+    """Same as match_probabilities, for waiting times in seconds.
+
+    An order placed at a block is matched by the counter orders of the
+    following blocks mined at most waiting_seconds after it, and orders
+    are placed at the blocks mined at least waiting_seconds before the
+    last block of the dataset.
+    """
+    times = dataset.block_times
+    if times is None:
+        raise ValueError(
+            "The dataset has no block times: load it from a swap store "
+            "created from an export with a block_time column.")
+    pair, position = counter_occurrences(dataset, focus_pairs)
+    probabilities = np.zeros((len(focus_pairs), len(waiting_seconds)))
+    for j, seconds in enumerate(waiting_seconds):
+        nr_orders = int(np.searchsorted(times, times[-1] - seconds, side='right'))
+        if nr_orders == 0:
+            continue
+        # The window of the order at block p starts at p + 1 and contains
+        # position o if times[o] - times[p] <= seconds.
+        window_lo = np.searchsorted(times, times[position] - seconds, side='left') + 1
+        hits = _count_hits(pair, position, window_lo, len(focus_pairs), 1, nr_orders + 1)
+        probabilities[:, j] = hits / nr_orders
+    return probabilities
+
+
+def volume_match_probabilities(dataset, focus_pairs, waiting_times):
+    """Fraction of the volume of the orders of each focus pair that could
+    be matched by the volume of its counter orders in the waiting_time
+    blocks following them, for every waiting time.
+
+    The orders of focus pair (A, B, ...) sell A for B, and their counter
+    orders buy A, so both volumes are amounts of A. An order placed at
+    block p is matched up to the amount of A bought in the blocks
+    p + 1 .. p + waiting_time, which is the difference of two prefix sums
+    of the counter volume of the pair along the block axis. As in
+    match_probabilities, every order is considered on its own, and only
+    the orders placed at the blocks 0 .. nr_blocks - waiting_time - 1.
+
+    Returns an array of shape (len(focus_pairs), len(waiting_times)).
+    """
+    sold, bought = dataset.amounts()
+    n = dataset.nr_blocks
+    # Per pair prefix sums of the counter volume, stored one pair after
+    # the other and indexed by pair * n + position. Raw amounts of
+    # different tokens differ by many orders of magnitude, so volumes are
+    # summed as fractions of the total counter volume of their pair, or a
+    # single float prefix sum would lose the small ones.
+    pair, rows = _counter_orders(dataset, focus_pairs)
+    keys = pair * n + dataset.block_positions[rows]
+    by_key = np.argsort(keys, kind='stable')
+    keys, pair, counter_volume = keys[by_key], pair[by_key], bought[rows][by_key]
+    total_counter_volume = np.bincount(pair, weights=counter_volume, minlength=len(focus_pairs))
+    cumulative_fraction = np.concatenate([[0.0], np.cumsum(np.divide(
+        counter_volume, total_counter_volume[pair],
+        out=np.zeros(len(pair)), where=total_counter_volume[pair] > 0))])
+
+    order_pair, order_rows = _counter_orders(dataset, [(p[1], p[0]) for p in focus_pairs])
+    order_position = dataset.block_positions[order_rows]
+    order_volume = sold[order_rows]
+    probabilities = np.zeros((len(focus_pairs), len(waiting_times)))
+    for j, k in enumerate(waiting_times):
+        placed = order_position < n - k
+        first = order_pair[placed] * n + order_position[placed] + 1
+        counter_volume = total_counter_volume[order_pair[placed]] * (
+            cumulative_fraction[np.searchsorted(keys, first + k)] -
+            cumulative_fraction[np.searchsorted(keys, first)])
+        matched = np.bincount(
+            order_pair[placed], weights=np.minimum(order_volume[placed], counter_volume),
+            minlength=len(focus_pairs))
+        volume = np.bincount(
+            order_pair[placed], weights=order_volume[placed], minlength=len(focus_pairs))
+        probabilities[:, j] = np.divide(
+            matched, volume, out=np.zeros(len(focus_pairs)), where=volume > 0)
+    return probabilities
+
+
+def sampled_match_probabilities(dataset, focus_pairs, waiting_time, target_width=0.01,
+                                confidence=0.95, nr_strata=100, samples_per_stratum=10,
+                                seed=0):
+    """Approximate match_probabilities(dataset, focus_pairs, [waiting_time]).
+
+    The blocks where orders are placed are split into nr_strata strata of
+    consecutive blocks, and every round samples samples_per_stratum more
+    blocks (without replacement) of each stratum. A pair stops being
+    evaluated once the confidence interval of its probability is at most
+    target_width wide, or all blocks are sampled.
+
+    Returns (probabilities, error_bounds, nr_samples): error_bounds is the
+    half width of the confidence interval of every pair, and nr_samples
+    the number of blocks that were evaluated for it.
+    """
+    n = dataset.nr_blocks
+    nr_orders = n - waiting_time
+    # Only the orders in the windows of the sampled blocks are joined
+    # with the focus pairs, so the cost grows with the number of samples
+    # and not with the size of the dataset.
+    nr_tokens, combo_pair, combo_code = _counter_combos(dataset, focus_pairs)
+    by_code = np.argsort(combo_code, kind='stable')
+    combo_pair, combo_code = combo_pair[by_code], combo_code[by_code]
+    rng = np.random.default_rng(seed)
+    bounds = np.linspace(0, nr_orders, min(nr_strata, nr_orders) + 1).astype(np.int64)
+    sizes = np.diff(bounds)
+    weights = sizes / nr_orders
+    strata = [bounds[h] + rng.permutation(sizes[h]) for h in range(len(sizes))]
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+
+    hits = np.zeros((len(focus_pairs), len(sizes)))
+    counts = np.zeros((len(focus_pairs), len(sizes)))
+    error_bounds = np.full(len(focus_pairs), np.inf)
+    active = np.arange(len(focus_pairs))
+    active_index = np.full(len(focus_pairs), -1)
+    for start in range(0, sizes.max(initial=0), samples_per_stratum):
+        if len(active) == 0:
+            break
+        samples = [s[start:start + samples_per_stratum] for s in strata]
+        stratum = np.repeat(np.arange(len(sizes)), [len(s) for s in samples])
+        samples = np.concatenate(samples)
+        # An order at block p is matched by the counter orders of the
+        # blocks p + 1 .. p + waiting_time, i.e. of these rows.
+        lo = dataset.block_offsets[samples + 1]
+        hi = dataset.block_offsets[samples + waiting_time + 1]
+        rows = _ranges(lo, hi)
+        sample = np.repeat(np.arange(len(samples)), hi - lo)
+        code = dataset.sell_token[rows].astype(np.int64) * nr_tokens + dataset.buy_token[rows]
+        code_lo = np.searchsorted(combo_code, code, side='left')
+        code_hi = np.searchsorted(combo_code, code, side='right')
+        pair = combo_pair[_ranges(code_lo, code_hi)]
+        sample = np.repeat(sample, code_hi - code_lo)
+        active_index[active] = np.arange(len(active))
+        is_active = active_index[pair] >= 0
+        matched = np.zeros((len(active), len(samples)), dtype=bool)
+        matched[active_index[pair[is_active]], sample[is_active]] = True
+        for h in np.unique(stratum):
+            in_stratum = stratum == h
+            hits[active, h] += matched[:, in_stratum].sum(axis=1)
+            counts[active, h] += np.count_nonzero(in_stratum)
+        # Stratified variance, with the proportions of every stratum
+        # smoothed so that a stratum without any hit yet does not count
+        # as certain, and the finite population correction.
+        smoothed = (hits[active] + 1) / (counts[active] + 2)
+        variance = weights ** 2 * smoothed * (1 - smoothed) / counts[active] * \
+            (1 - counts[active] / sizes)
+        error_bounds[active] = z * np.sqrt(variance.sum(axis=1))
+        active_index[active] = -1
+        active = active[2 * error_bounds[active] > target_width]
+
+    probabilities = (weights * hits / np.maximum(counts, 1)).sum(axis=1)
+    return probabilities, error_bounds, counts.sum(axis=1).astype(np.int64)
+
+
+def next_occurrence(presence):
+    """For every block position, the first position at or after it where
+    presence is set, or len(presence) if there is none (a backward sweep)."""
+    n = len(presence)
+    positions = np.where(presence, np.arange(n), n)
+    return np.minimum.accumulate(positions[::-1])[::-1]
+
+
+def waiting_time_histograms(dataset, focus_pairs, max_waiting_time):
+    """Distribution of the number of blocks an order waits for the next
+    block with a counter order, for every focus pair.
+
+    Orders are placed at the blocks 0 .. nr_blocks - max_waiting_time - 1
+    of the axis. Returns hist of shape
+    (len(focus_pairs), max_waiting_time + 2): hist[i, w] is the number of
+    these blocks whose next counter order of focus_pairs[i] is w blocks
+    later, for 1 <= w <= max_waiting_time, and hist[i, -1] the number of
+    blocks without one in the next max_waiting_time blocks.
+    """
+    nr_orders = dataset.nr_blocks - max_waiting_time
+    if nr_orders <= 0:
+        raise ValueError(
+            f"The dataset has {dataset.nr_blocks} blocks, it needs more than "
+            f"max_waiting_time={max_waiting_time} to place any order.")
+    pair, position = counter_occurrences(dataset, focus_pairs)
+    bounds = np.searchsorted(pair, np.arange(len(focus_pairs) + 1))
+    hist = np.zeros((len(focus_pairs), max_waiting_time + 2), dtype=np.int64)
+    for i in range(len(focus_pairs)):
+        presence = np.zeros(dataset.nr_blocks, dtype=bool)
+        presence[position[bounds[i]:bounds[i + 1]]] = True
+        waiting_time = next_occurrence(presence)[1:nr_orders + 1] - np.arange(nr_orders)
+        hist[i] = np.bincount(
+            np.minimum(waiting_time, max_waiting_time + 1), minlength=max_waiting_time + 2)
+    return hist
+
+
+def waiting_time_cdf(hist):
+    """cdf[i, k] = probability of waiting at most k blocks, for k up to
+    the max_waiting_time of hist (cdf[i, 0] = 0)."""
+    return np.cumsum(hist[:, :-1], axis=1) / hist.sum(axis=1, keepdims=True)
+
+
+def expected_waiting_time(hist):
+    """Expected waiting time, counting only the orders matched within
+    max_waiting_time blocks; it is meaningful if the cdf gets close to 1."""
+    waiting_times = np.arange(hist.shape[1] - 1)
+    return (hist[:, :-1] @ waiting_times) / hist.sum(axis=1)
+
+
+def waiting_time_quantile(hist, q):
+    """Smallest waiting time k with cdf(k) >= q, or -1 if it is larger
+    than max_waiting_time."""
+    cdf = waiting_time_cdf(hist)
+    k = np.argmax(cdf >= q, axis=1)
+    return np.where(cdf[:, -1] >= q, k, -1)
+
+
+def conditional_match_probabilities(dataset, focus_pairs, waiting_times,
+                                    min_nr_of_orders=0):
+    """Probability that a counter order of each focus pair is found in the
+    waiting_time blocks starting at a block containing an order of the
+    pair, for every waiting time.
+
+    Focus pairs are (sell token, buy token) pairs, whose orders are the
+    counter orders of the reversed pair. Pairs with orders in at most
+    min_nr_of_orders blocks are skipped before any other work, and get a
+    probability of 0. Returns an array of shape
+    (len(focus_pairs), len(waiting_times)).
+    """
+    order_pair, order_position = counter_occurrences(
+        dataset, [tuple(reversed(p)) for p in focus_pairs])
+    nr_orders = np.bincount(order_pair, minlength=len(focus_pairs))
+    considered = np.flatnonzero(nr_orders > min_nr_of_orders)
+    probabilities = np.zeros((len(focus_pairs), len(waiting_times)))
+    if len(considered) == 0:
+        return probabilities
+
+    counter_pair, counter_position = counter_occurrences(
+        dataset, [focus_pairs[i] for i in considered])
+    counter_bounds = np.searchsorted(counter_pair, np.arange(len(considered) + 1))
+    order_bounds = np.searchsorted(order_pair, np.arange(len(focus_pairs) + 1))
+    for j, i in enumerate(considered):
+        # next block with a counter order, built once per pair
+        presence = np.zeros(dataset.nr_blocks, dtype=bool)
+        presence[counter_position[counter_bounds[j]:counter_bounds[j + 1]]] = True
+        position = order_position[order_bounds[i]:order_bounds[i + 1]]
+        distance = next_occurrence(presence)[position] - position
+        for l, k in enumerate(waiting_times):
+            # orders whose k blocks are all in the dataset
+            in_range = position <= dataset.nr_blocks - k
+            nr_in_range = np.count_nonzero(in_range)
+            if nr_in_range > 0:
+                probabilities[i, l] = np.count_nonzero(distance[in_range] < k) / nr_in_range
+    return probabilities
+
+
+def migration_sweep(dataset, focus_pairs, migration_percentages, waiting_times,
+                    max_amount_swaps_retail_traders=50, verbose=True):
+    """match_probabilities for every migration percentage, from a single
+    dataset loaded with all swaps.
+
+    The orders migrating for percentage p are dataset.sample(p), so the
+    subsets are nested. Arbitrageurs are filtered out of every subset as
+    if it had been loaded on its own. Returns an array of shape
+    (len(focus_pairs), len(migration_percentages), len(waiting_times)).
+    """
+    probabilities = np.zeros((len(focus_pairs), len(migration_percentages), len(waiting_times)))
+    for j, migration_percentage in enumerate(migration_percentages):
+        subset = dataset.sample(migration_percentage).filter_out_arbitrageurs(
+            max_amount_swaps_retail_traders, verbose)
+        probabilities[:, j, :] = match_probabilities(subset, focus_pairs, waiting_times)
+    return probabilities
@@ -0,0 +1,197 @@
+"""
+Monte Carlo replicates of the migration scenarios.
+
+The probability scripts evaluate a single random subset of the swaps
+migrating from uniswap. This script evaluates nr_replicates subsets, each
+sampled with its own seed exactly as data_usage_percentage would sample
+it at load, and reports the mean and a percentile band of the probability
+of match of every pair, for every migration percentage and waiting time.
+
+The swap store is loaded once. Its order arrays are saved to a temporary
+directory and memory-mapped by the worker processes, so they are shared
+through the page cache instead of being pickled to every worker.
+
+Usage:
+python -m src.migration_replicates data/dune_download/merged_store --nr_replicates 1000
+"""
+
+import argparse
+import csv
+import os
+import shutil
+import tempfile
+from multiprocessing import Pool
+
+import numpy as np
+
+from .compression import open_file
+from .match_probability import migration_sweep
+from .sampling import sample_keys
+from .swap_dataset import SwapDataset
+from .swap_store import SwapStore
+from .utils import pair_label
+
+SHARED_ARRAYS = ['block', 'index', 'sell_token', 'buy_token', 'address']
+
+# State of a worker process, set by _init_worker.
+_worker = {}
+
+
+def _share_dataset(dataset, index, shared_dir):
+    arrays = {
+        'block': dataset.block, 'index': index, 'sell_token': dataset.sell_token,
+        'buy_token': dataset.buy_token, 'address': dataset.address,
+        'axis': np.array([dataset.first_block, dataset.nr_blocks])
+    }
+    for name, values in arrays.items():
+        np.save(os.path.join(shared_dir, name + '.npy'), values)
+
+
+def _init_worker(shared_dir, sweep_args):
+    arrays = {
+        name: np.load(os.path.join(shared_dir, name + '.npy'), mmap_mode='r')
+        for name in SHARED_ARRAYS + ['axis']
+    }
+    first_block, nr_blocks = (int(v) for v in arrays['axis'])
+    _worker['dataset'] = SwapDataset(
+        first_block, nr_blocks, arrays['block'], arrays['sell_token'],
+        arrays['buy_token'], arrays['address']
+    )
+    _worker['index'] = arrays['index']
+    _worker['sweep_args'] = sweep_args
+
+
+def _run_replicate(seed):
+    dataset = _worker['dataset']
+    dataset.key = sample_keys(seed, dataset.block, _worker['index'])
+    return migration_sweep(dataset, *_worker['sweep_args'], verbose=False)
+
+
+def run_replicates(dataset, index, focus_pairs, migration_percentages,
+                   waiting_times, nr_replicates, seed=0, nr_processes=None,
+                   max_amount_swaps_retail_traders=50):
+    """migration_sweep for the seeds seed .. seed + nr_replicates - 1.
+
+    index is the index inside its block of the swap of every order of the
+    dataset. Returns an array of shape (nr_replicates, len(focus_pairs),
+    len(migration_percentages), len(waiting_times)).
+    """
+    sweep_args = (focus_pairs, migration_percentages, waiting_times,
+                  max_amount_swaps_retail_traders)
+    shared_dir = tempfile.mkdtemp(prefix='migration_replicates_')
+    try:
+        _share_dataset(dataset, index, shared_dir)
+        with Pool(nr_processes, _init_worker, (shared_dir, sweep_args)) as pool:
+            seeds = range(seed, seed + nr_replicates)
+            chunksize = max(1, nr_replicates // (4 * (nr_processes or os.cpu_count())))
+            return np.stack(pool.map(_run_replicate, seeds, chunksize))
+    finally:
+        shutil.rmtree(shared_dir)
+
+
+def summarize(replicates, percentiles=(2.5, 97.5)):
+    """Mean and percentile bands over the replicates (the first axis)."""
+    return replicates.mean(axis=0), np.percentile(replicates, percentiles, axis=0)
+
+
+def write_summary(filename, focus_pairs, migration_percentages, waiting_times,
+                  mean, bands, percentiles):
+    with open_file(filename, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(
+            ['pair', 'migration_percentage', 'waiting_time', 'mean'] +
+            [f'p{p:g}' for p in percentiles]
+        )
+        for i, focus_pair in enumerate(focus_pairs):
+            for j, migration_percentage in enumerate(migration_percentages):
+                for k, waiting_time in enumerate(waiting_times):
+                    writer.writerow(
+                        [pair_label(focus_pair), migration_percentage, waiting_time,
+                         mean[i, j, k]] + list(bands[:, i, j, k])
+                    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Probability of match of every pair over many sampled migration scenarios.')
+
+    parser.add_argument(
+        'store_dir',
+        type=str,
+        help='Path to the swap store (see swap_store.py).'
+    )
+
+    parser.add_argument(
+        '--output',
+        type=str,
+        default='data/migration_replicates.csv',
+        help='Path to the output csv file (may be compressed, e.g. .csv.gz).'
+    )
+
+    parser.add_argument(
+        '--nr_replicates',
+        type=int,
+        default=100,
+        help='Number of independently seeded samples.'
+    )
+
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=0,
+        help='Seed of the first replicate; replicate r uses seed + r.'
+    )
+
+    parser.add_argument(
+        '--migration_percentages',
+        type=float,
+        nargs='+',
+        default=[50],
+        help='Percentages of the swaps migrating from uniswap.'
+    )
+
+    parser.add_argument(
+        '--waiting_times',
+        type=int,
+        nargs='+',
+        default=[4],
+        help='Waiting times in blocks.'
+    )
+
+    parser.add_argument(
+        '--percentiles',
+        type=float,
+        nargs='+',
+        default=[2.5, 97.5],
+        help='Percentiles reported over the replicates.'
+    )
+
+    parser.add_argument(
+        '--whole_swaps',
+        action='store_true',
+        help='Consider routed swaps as a single order instead of splitting them into hops.'
+    )
+
+    parser.add_argument(
+        '--nr_processes',
+        type=int,
+        default=None,
+        help='Number of worker processes. Defaults to the number of cpus.'
+    )
+
+    args = parser.parse_args()
+
+    store = SwapStore(args.store_dir)
+    dataset = SwapDataset.from_store(store, not args.whole_swaps)
+    index = np.asarray(store.index)[dataset.swap]
+    focus_pairs = dataset.focus_pairs()
+    replicates = run_replicates(
+        dataset, index, focus_pairs, args.migration_percentages,
+        args.waiting_times, args.nr_replicates, args.seed, args.nr_processes
+    )
+    mean, bands = summarize(replicates, args.percentiles)
+    write_summary(
+        args.output, focus_pairs, args.migration_percentages,
+        args.waiting_times, mean, bands, args.percentiles
+    )
+    print(f"Wrote {len(focus_pairs)} pairs x {args.nr_replicates} replicates to {args.output}")
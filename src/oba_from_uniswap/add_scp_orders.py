@@ -2,10 +2,12 @@ import argparse
 import json
 import csv
 
+from ..compression import iter_json, open_file
+
 def main(oba_file, scp_file, oba_scp_file):
-    with open(oba_file, "r") as f:
-        oba = json.load(f)['orders']
-    with open(scp_file, "r") as f:
+    with open_file(oba_file, "r") as f:
+        oba = list(iter_json(f, 'orders'))
+    with open_file(scp_file, "r") as f:
         reader = csv.reader(f)
         scp = [{
             'timestamp': int(row[0]),
@@ -32,7 +34,7 @@ def main(oba_file, scp_file, oba_scp_file):
         key=lambda o: o['timestamp'] if 'timestamp' in o else o['uniswap']['timestamp']
     )
 
-    with open(oba_scp_file, "w+") as f:
+    with open_file(oba_scp_file, "w+") as f:
         json.dump({'orders': merged}, f, indent=2)
     
 parser = argparse.ArgumentParser(
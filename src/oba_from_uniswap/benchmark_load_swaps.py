@@ -0,0 +1,81 @@
+# Benchmarks the dune csv parser used by create_oba.load_swaps against the
+# previous ast.literal_eval based implementation, e.g.:
+#
+# python -m src.oba_from_uniswap.benchmark_load_swaps \
+#     data/dune_download/swaps_data_from_router_11740000-11741000.csv
+
+import argparse
+import ast
+import csv
+from timeit import repeat
+
+from ..dune_csv import iter_swap_chunks
+
+
+# Previous implementation of load_swaps, except that columns are located
+# through the header so that it can run on any of the dune exports.
+def load_swaps_literal_eval(filename):
+    r = []
+    with open(filename, "r") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        for row in reader:
+            row = dict(zip(header, row))
+            path = row['path'].replace("{", "[").replace("}", "]")
+            path = ast.literal_eval(path)
+            path = ['0x' + address[-40:] for address in path]
+            output_amounts = row['output_amounts'].replace("{", "[").replace("}", "]")
+            output_amounts = ast.literal_eval(output_amounts.replace('L',''))
+            output_amounts = list(map(int, output_amounts))
+            if path[0]==path[-1]:
+                continue
+            r.append({
+                'block_number': int(row['block_number']),
+                'index': int(row['index']),
+                'sell_amount': int(row['sell_amount']),
+                'buy_amount': int(row['buy_amount']),
+                'path': path,
+                'output_amounts': output_amounts,
+                'address': row['address']
+            })
+    return r
+
+
+def load_swaps_dune_csv(filename):
+    r = []
+    for chunk in iter_swap_chunks(filename):
+        r += [s for s in chunk if s['path'][0] != s['path'][-1]]
+    return r
+
+
+def main(filename, nr_runs):
+    expected = load_swaps_literal_eval(filename)
+    parsed = load_swaps_dune_csv(filename)
+    assert len(expected) == len(parsed)
+    for e, p in zip(expected, parsed):
+        assert all(p[k] == v for k, v in e.items())
+    print(f"{len(parsed)} swaps, best of {nr_runs} runs:")
+    for f in [load_swaps_literal_eval, load_swaps_dune_csv]:
+        t = min(repeat(lambda: f(filename), number=1, repeat=nr_runs))
+        print(f"{f.__name__:>25}: {t:.3f}s ({len(parsed) / t:,.0f} swaps/s)")
+
+
+parser = argparse.ArgumentParser(
+    description='Benchmark parsing of dune swap csv files.')
+
+parser.add_argument(
+    'filename',
+    type=str,
+    help='Path to input csv file.'
+)
+
+parser.add_argument(
+    '--nr_runs',
+    type=int,
+    default=5,
+    help='Number of timed runs per implementation.'
+)
+
+args = parser.parse_args()
+
+main(args.filename, args.nr_runs)
@@ -1,9 +1,11 @@
 import pandas as pd
-import json
 import re
 import numpy as np
 import glob
 
+from ..compression import find_file, iter_json, load_json_members, open_file
+
+
 class EmptySolutionError(Exception):
     pass
 
@@ -38,33 +40,19 @@ def get_largest_element_sequence(a, b, test):
         yield b[idx_b]
 
 def load_block_data_file_to_df(fname):
-    with open(fname, 'r') as f:
-        d = json.load(f)
-    eth_price_usd = compute_avg_eth_price_usd(d['orders'])
-    d = [
-        {
-            'block': o['uniswap']['block'],
-            'index': o['uniswap']['index'],
-            'sell_token': o['sellToken'],
-            'buy_token': o['buyToken'],
-            'max_buy_amount': o['maxBuyAmount'] if not o['isSellOrder'] else None,
-            'max_sell_amount': o['maxSellAmount'] if o['isSellOrder'] else None,
-            'sell_token_price_eth': o['sellTokenPriceETH'],
-            'buy_token_price_eth': o['buyTokenPriceETH'],
-            'sell_token_price_usd': o['sellTokenPriceETH'] * eth_price_usd,
-            'buy_token_price_usd': o['buyTokenPriceETH'] * eth_price_usd,
-            'timestamp': o['uniswap']['timestamp'],
-            'exec_sell_amount': o['uniswap']['amounts'][0],
-            'exec_buy_amount': o['uniswap']['amounts'][-1],
-            'nr_pools': len(o['uniswap']['amounts']) - 1,
-            'is_sell_order': o['isSellOrder'],
-            'address': o['address'],
-            'sell_reserve': float(o['uniswap']['balancesSellToken'][0]),
-            'buy_reserve': float(o['uniswap']['balancesBuyToken'][-1]),
-            #'max_xrate': get_max_xrate(o)
-        } for o in d['orders']
-    ]
+    # orders are decoded one at a time, only the fields below are kept
+    price_fields = ['sellToken', 'buyToken', 'sellTokenDailyPriceUSD', 'buyTokenDailyPriceUSD']
+    weth_orders = []
+    d = []
+    with open_file(fname, 'r') as f:
+        for o in iter_json(f, 'orders'):
+            if 'WETH' in {o['sellToken'], o['buyToken']}:
+                weth_orders.append({k: o[k] for k in price_fields})
+            d.append(order_to_record(o))
+    eth_price_usd = compute_avg_eth_price_usd(weth_orders)
     df = pd.DataFrame.from_records(d)
+    df['sell_token_price_usd'] = df.sell_token_price_eth * eth_price_usd
+    df['buy_token_price_usd'] = df.buy_token_price_eth * eth_price_usd
     df['xrate'] = df.exec_sell_amount/df.exec_buy_amount
     df['block_index'] = df.apply(lambda r: '_'.join(r[['block', 'index']].astype(str).values), axis=1)
     df['token_pair'] = df.apply(lambda r: '-'.join(sorted([r['sell_token'],r['buy_token']])), axis=1)
@@ -74,25 +62,45 @@ def load_block_data_file_to_df(fname):
 
     return df.set_index('block_index')
 
+def order_to_record(o):
+    return {
+        'block': o['uniswap']['block'],
+        'index': o['uniswap']['index'],
+        'sell_token': o['sellToken'],
+        'buy_token': o['buyToken'],
+        'max_buy_amount': o['maxBuyAmount'] if not o['isSellOrder'] else None,
+        'max_sell_amount': o['maxSellAmount'] if o['isSellOrder'] else None,
+        'sell_token_price_eth': o['sellTokenPriceETH'],
+        'buy_token_price_eth': o['buyTokenPriceETH'],
+        'timestamp': o['uniswap']['timestamp'],
+        'exec_sell_amount': o['uniswap']['amounts'][0],
+        'exec_buy_amount': o['uniswap']['amounts'][-1],
+        'nr_pools': len(o['uniswap']['amounts']) - 1,
+        'is_sell_order': o['isSellOrder'],
+        'address': o['address'],
+        'sell_reserve': float(o['uniswap']['balancesSellToken'][0]),
+        'buy_reserve': float(o['uniswap']['balancesBuyToken'][-1]),
+        #'max_xrate': get_max_xrate(o)
+    }
+
 def remove_most_active_users(df_exec, fraction_to_remove):
     nr_addresses = df_exec.address.nunique()
     addresses = df_exec.address.value_counts().iloc[round(nr_addresses * fraction_to_remove):].index
     return df_exec[df_exec.address.isin(addresses)]
 
 def load_solver_solution(fname):
-    with open(fname, 'r') as f:
-        d = json.load(f)
-    d = [
-        {
-            'block': int(oid.split('-')[0]),
-            'index': int(oid.split('-')[1]),
-            'sell_token': o['sell_token'],
-            'buy_token': o['buy_token'],
-            'exec_sell_amount': int(o['exec_sell_amount'])*1e-18,
-            'exec_buy_amount': int(o['exec_buy_amount'])*1e-18,
-            'is_sell_order': o['is_sell_order']
-        } for oid, o in d['orders'].items()
-    ]
+    with open_file(fname, 'r') as f:
+        d = [
+            {
+                'block': int(oid.split('-')[0]),
+                'index': int(oid.split('-')[1]),
+                'sell_token': o['sell_token'],
+                'buy_token': o['buy_token'],
+                'exec_sell_amount': int(o['exec_sell_amount'])*1e-18,
+                'exec_buy_amount': int(o['exec_buy_amount'])*1e-18,
+                'is_sell_order': o['is_sell_order']
+            } for oid, o in iter_json(f, 'orders')
+        ]
     if len(d) == 0:
         raise EmptySolutionError()
     df = pd.DataFrame.from_records(d)
@@ -114,7 +122,7 @@ def merge_exec_and_solved(fname, df_exec, from_timestamp, to_timestamp):
     return df
 
 def create_batch_table(solution_fname, df_exec):
-    m = re.search(r'_([0-9]+)\-([0-9]+)(\-[0-9]+)*\.json$',solution_fname)
+    m = re.search(r'_([0-9]+)\-([0-9]+)(\-[0-9]+)*\.json(\.\w+)?$',solution_fname)
     from_timestamp, to_timestamp = int(m[1]), int(m[2])
     return merge_exec_and_solved(solution_fname, df_exec, from_timestamp, to_timestamp)
 
@@ -128,7 +136,7 @@ def compute_mean_gp_rel_surplus(df):
 
 def create_batches_table(solution_dir, df_exec):
     dfs = []
-    for fname in glob.glob(f'{solution_dir}/*.json'):
+    for fname in glob.glob(f'{solution_dir}/*.json*'):
         try:
             dfs.append(create_batch_table(fname, df_exec))
         except EmptySolutionError:
@@ -192,7 +200,7 @@ def filter_batches_with_large_liquidity_updates(df_sol):
 
 def get_dfs(instance_path, batch_duration, nr_tokens, user_frac, limit_xrate_relax_frac):
     data_path = f'{instance_path}/s{batch_duration}-t{nr_tokens}-u{user_frac}-l{limit_xrate_relax_frac}/'
-    df_exec = load_block_data_file_to_df(f'{data_path}/per_block.json')
+    df_exec = load_block_data_file_to_df(find_file(f'{data_path}/per_block.json'))
     df_sol = create_batches_table(f'{data_path}/solutions/', df_exec)
 
     # remove batches where there were untouched orders
@@ -215,11 +223,11 @@ def get_dfs(instance_path, batch_duration, nr_tokens, user_frac, limit_xrate_rel
 
 def get_block_data_file(instance_path, batch_duration, nr_tokens, user_frac, limit_xrate_relax_frac):
     data_path = f'{instance_path}/s{batch_duration}-t{nr_tokens}-u{user_frac}-l{limit_xrate_relax_frac}/'
-    return load_block_data_file_to_df(f'{data_path}/per_block.json')
+    return load_block_data_file_to_df(find_file(f'{data_path}/per_block.json'))
 
 def get_prices_at_blocks(data_path, blocks, tokens):
-    with open(f'{data_path}/per_block.json', 'r') as f:
-        d = json.load(f)
+    with open_file(find_file(f'{data_path}/per_block.json'), 'r') as f:
+        d = load_json_members(f, ['spot_prices'])
     prices_in_file = {int(k): v for k, v in d['spot_prices'].items()}
     blocks_in_file = list(prices_in_file.keys())
 
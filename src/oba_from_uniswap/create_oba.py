@@ -1,8 +1,6 @@
 # Postprocesses csv files obtained from dune analytics with routed trades
 
 import argparse
-import ast
-import csv
 import json
 from datetime import date, datetime, time, timezone
 from fractions import Fraction as F
@@ -13,6 +11,10 @@ from frozendict import frozendict
 from networkx.algorithms.shortest_paths.generic import shortest_path, has_path
 from tqdm import tqdm
 from ..dune_query import run_dune_query
+from ..compression import open_file
+from ..dune_csv import iter_swap_chunks
+from ..amounts import AmountArray
+from ..records import Swap
 
 from ..subgraph import GraphQLClient, UniswapClient, UnrecoverableError
 from networkx import Graph
@@ -35,43 +37,23 @@ disk_cache = Index(".cache")
 print(f"Cache size: {len(disk_cache)}")
 
 
-def load_swaps(filename):
-    """Parse a csv file to a list of dicts."""
+def load_swaps(filename, from_block=None, to_block=None):
+    """Parse a csv file to a list of Swap records.
+
+    If given, only swaps with from_block <= block_number <= to_block are
+    read (see csv_index.py)."""
     r = []
-    with open(filename, "r") as f:
-        reader = csv.reader(f)
-        first = True
-        for row in reader:
-            # Skip header.
-            if first:
-                first = False
-                continue
-            (block_number, index, sell_amount,
-            buy_amount, path, output_amounts, block_time, address) = row
-
-            path = path.replace("{", "[").replace("}", "]")
-            path = ast.literal_eval(path)
-            path = ['0x' + address[2:] for address in path]
-            output_amounts = output_amounts.replace("{", "[").replace("}", "]")
-            output_amounts = ast.literal_eval(output_amounts.replace('L',''))
-            output_amounts = list(map(int, output_amounts))
-            if path[0]==path[-1]:   # this occasionally happens for some reason
-                continue
-            r.append({
-                'block_number': int(block_number),
-                'index': int(index),
-                'sell_amount': int(sell_amount),
-                'buy_amount': int(buy_amount),
-                'path': path,
-                'output_amounts': output_amounts,
-                'block_time': int(float(block_time)),
-                'address': address
-            })
+    for chunk in iter_swap_chunks(filename, from_block=from_block, to_block=to_block):
+        r += [
+            Swap.from_row(swap) for swap in chunk
+            # this occasionally happens for some reason
+            if swap['path'][0] != swap['path'][-1]
+        ]
     return r
 
 
 def load_tokens(filename):
-    with open(filename, "r") as f:
+    with open_file(filename, "r") as f:
         return json.load(f)
 
 
@@ -436,13 +418,24 @@ def get_spot_prices_in_eth_from_dune(swaps, pool_ids, token_info, block_interval
         prices[block] = block_prices
     return prices
 
+def add_human_amounts_to_swaps(swaps, token_info):
+    """Convert the output amounts of all swaps to token units at once."""
+    amounts = AmountArray.from_ints(a for swap in swaps for a in swap['output_amounts'])
+    decimals = [
+        int(token_info[t]['decimals']) for swap in swaps for t in swap['path']
+    ]
+    human_amounts = amounts.to_human(decimals).tolist()
+    offset = 0
+    for swap in swaps:
+        nr_amounts = len(swap['output_amounts'])
+        swap['human_amounts'] = human_amounts[offset:offset + nr_amounts]
+        offset += nr_amounts
+    return swaps
+
 def swap_to_order(swap, token_info):
     order = {}
     amm_path = [token_info[token_id]['symbol'] for token_id in swap['path']]
-    amm_amounts = [
-        a * 10 ** -int(token_info[t]['decimals'])
-        for a, t in zip(swap['output_amounts'], swap['path'])
-    ]
+    amm_amounts = swap['human_amounts']
 
     order['sellToken'] = amm_path[0]
     order['buyToken'] = amm_path[-1]
@@ -508,9 +501,9 @@ def restrict_to_top_most_traded_tokens_by_nr_trades(swaps, nr_tokens):
     tokens = set(tokens[:nr_tokens])
     return [s for s in swaps if swap_is_accepted(s, tokens)] 
 
-def process(csv_filename, max_nr_tokens, output_filename):
+def process(csv_filename, max_nr_tokens, output_filename, from_block=None, to_block=None):
     #token_info = load_tokens(tokens_filename)
-    swaps = load_swaps(csv_filename)
+    swaps = load_swaps(csv_filename, from_block, to_block)
     swaps = remove_duplicate_swaps_in_same_block_index(swaps)
     #swaps = filter_swaps(swaps, token_info.keys())
     if max_nr_tokens is not None:
@@ -525,6 +518,7 @@ def process(csv_filename, max_nr_tokens, output_filename):
     
     #spot_prices = get_spot_prices_in_eth_from_dune(swaps, pool_ids, token_info)
     #swaps = add_block_token_prices_to_swaps_from_spot_prices(swaps, spot_prices)
+    swaps = add_human_amounts_to_swaps(swaps, token_info)
     orders = [swap_to_order(swap, token_info) for swap in swaps]
 
     #first_block = list(spot_prices.keys())[0]
@@ -534,7 +528,7 @@ def process(csv_filename, max_nr_tokens, output_filename):
     #    for b in range(first_block, last_block + 1, 60)
     #}
 
-    with open(output_filename, 'w+') as f:
+    with open_file(output_filename, 'w+') as f:
         json.dump({
             'orders': orders,
             #'spot_prices': spot_prices_every_15m
@@ -564,6 +558,20 @@ parser.add_argument(
     help='Name of output OBA raw instance json.'
 )
 
+parser.add_argument(
+    '--from_block',
+    type=int,
+    default=None,
+    help='Only use swaps from this block on.'
+)
+
+parser.add_argument(
+    '--to_block',
+    type=int,
+    default=None,
+    help='Only use swaps up to this block (inclusive).'
+)
+
 args = parser.parse_args()
 
-process(args.filename, args.max_nr_tokens, args.oba_file)
+process(args.filename, args.max_nr_tokens, args.oba_file, args.from_block, args.to_block)
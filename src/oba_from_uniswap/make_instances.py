@@ -7,6 +7,8 @@ from pathlib import Path
 import networkx as nx
 from networkx.algorithms.components import connected
 
+from ..compression import iter_json, open_file
+
 
 def timestamp(o):
     return o['timestamp'] if 'timestamp' in o else o['uniswap']['timestamp']
@@ -137,9 +139,10 @@ def batch_iterator(orders, batch_duration):
         idx = next_idx
 
 
-def load_json(filename):
-    with open(filename, "r") as f:
-        return json.load(f)
+def load_orders(filename):
+    """Orders of an OBA raw instance file, decoded one at a time."""
+    with open_file(filename, "r") as f:
+        return list(iter_json(f, 'orders'))
 
 def order_is_accepted(order, accepted_tokens):
     if 'uniswap' in order.keys():
@@ -285,9 +288,10 @@ def convert_to_gpv2_instance(batch, default_fee, exclude_market_makers=False):
 
 def main(
     oba_file, output_dir, batch_duration=60, max_nr_instances = None,
-    nr_tokens = None, user_fraction=1, default_fee=0, limit_xrate_relax_frac=0.01
+    nr_tokens = None, user_fraction=1, default_fee=0, limit_xrate_relax_frac=0.01,
+    instance_extension='.json'
 ):
-    oba_orders = load_json(oba_file)['orders']
+    oba_orders = load_orders(oba_file)
 
     # restrict instances to most traded tokens
     if nr_tokens is not None:
@@ -328,7 +332,7 @@ def main(
         for i, connected_batch in enumerate(connected_batches):
             connected_batch = convert_to_gpv2_instance(connected_batch, default_fee)
             file_suffix = f'-{i+1}' if len(connected_batches) > 1 else ''
-            with open(f'{output_dir}/instance_{batch_duration}_{first_timestamp}-{last_timestamp}{file_suffix}.json', 'w+') as f:
+            with open_file(f'{output_dir}/instance_{batch_duration}_{first_timestamp}-{last_timestamp}{file_suffix}{instance_extension}', 'w+') as f:
                 json.dump(connected_batch, f, indent=2)
 
     # Create restricted perblock file
@@ -340,7 +344,7 @@ def main(
             o['uniswap']['timestamp'] <= last_timestamp
             for first_timestamp, last_timestamp, _ in batches
         )]
-    with open(Path(output_dir).parent / Path(oba_file).name, "w+") as f:
+    with open_file(Path(output_dir).parent / Path(oba_file).name, "w+") as f:
         json.dump({'orders': oba_orders}, f, indent=2)
 
 
@@ -402,10 +406,17 @@ parser.add_argument(
     help='Default gp fee.'
 )
 
+parser.add_argument(
+    '--instance_extension',
+    type=str,
+    default='.json',
+    help='Extension of the instance files, e.g. .json.gz to compress them.'
+)
+
 args = parser.parse_args()
 
 main(
     args.per_block_file, args.output_dir, args.batch_duration, 
     args.max_nr_instances, args.nr_tokens, args.user_fraction,
-    args.default_fee, args.limit_xrate_relax_frac
+    args.default_fee, args.limit_xrate_relax_frac, args.instance_extension
 )
@@ -2,6 +2,8 @@ import json
 import argparse
 from math import ceil
 
+from ..compression import JsonStream, open_file
+
 parser = argparse.ArgumentParser(
     description='Convert an OBA file to a gp v2 (problem) instance file.')
 
@@ -33,23 +35,18 @@ parser.add_argument(
 
 args = parser.parse_args()
 
-with open(args.oba_file, 'r') as f:
-    d = json.load(f)
-
 exclude_market_makers = args.exclude_market_makers
 default_fee = args.default_fee
 
-tokens = {}
-for t in d['tokens']:
-    tokens[t] = {
+
+def convert_token(t):
+    return {
         'decimals': 18,  # We will use 18 decimal digits for all tokens
         'normalize_priority': 1 if t in ['DAI','USDC','USDT','OWL'] else 0
     }
 
-orders = {}
-for oid, o in d['orders'].items():
-    if exclude_market_makers and not o['fillOrKill']:
-        continue
+
+def convert_order(o):
     sell_token = o['sellToken']
     buy_token = o['buyToken']
     xrate = { t: p for p, t in o['limitXRate']}
@@ -61,7 +58,7 @@ for oid, o in d['orders'].items():
         buy_amount = int(o['maxBuyAmount'] * 10**18)
         sell_amount = int(ceil(buy_amount * xrate[sell_token] / xrate[buy_token]))
     
-    orders[oid] = {
+    return {
         'sell_token': sell_token,
         'buy_token': buy_token,
         'sell_amount': str(sell_amount),
@@ -70,9 +67,9 @@ for oid, o in d['orders'].items():
         'allow_partial_fill': not o['fillOrKill']
     }
 
-uniswaps = {}
-for uid, u in d['uniswaps'].items():
-    uniswaps[uid] = {
+
+def convert_uniswap(u):
+    return {
         'token1': u['token1'],
         'token2': u['token2'],
         'balance1': str(int(round(u['balance1'] * 10**18))),
@@ -81,6 +78,30 @@ for uid, u in d['uniswaps'].items():
         'fee': "0.003"
     }
 
+
+# The OBA file is decoded one token, order or uniswap at a time.
+tokens = {}
+orders = {}
+uniswaps = {}
+with open_file(args.oba_file, 'r') as f:
+    d = JsonStream(f)
+    for key in d.keys():
+        if key == 'tokens':
+            for _ in d.elements():
+                t = d.value()
+                tokens[t] = convert_token(t)
+        elif key == 'orders':
+            for oid in d.keys():
+                o = d.value()
+                if exclude_market_makers and not o['fillOrKill']:
+                    continue
+                orders[oid] = convert_order(o)
+        elif key == 'uniswaps':
+            for uid in d.keys():
+                uniswaps[uid] = convert_uniswap(d.value())
+        else:
+            d.skip()
+
 batch_auction = {
     'tokens': tokens,
     'orders': orders,
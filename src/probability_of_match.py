@@ -20,65 +20,140 @@ p(counter_order_in_next_k_blocks | order_in_this_block) = \
     = p(counter_order_in_next_k_blocks) = p(order_in_next_k_blocks)
 """
 
+from .chunked_match_probability import chunked_focus_pairs, chunked_match_probabilities, store_arbitrageurs
 from .download_swaps import get_swaps
-from .utils import find_order_in_next_k_blocks, generate_focus_pairs, filter_out_arbitrageur_swaps, plot_match_survivor
+from .heavy_hitters import sketch_arbitrageurs
+from .incremental_match_probability import update_match_statistics
+from .match_probability import match_probabilities, sampled_match_probabilities, time_match_probabilities, \
+    volume_match_probabilities
+from .utils import plot_match_survivor, pair_label
 from .read_csv import read_swaps_from_csv
+from .swap_dataset import SwapDataset
+from .swap_store import SwapStore
 
 # Parameters
 use_dune_data = True
+use_swap_store = True  # create it with: python -m src.swap_store
 consider_swaps_as_splitted_swaps = True
 use_cache = True
 waiting_time = 4
+# if set, waiting times are in seconds instead of blocks (as the
+# batch_duration of make_instances); needs swaps exported with block_time
+waiting_time_in_seconds = None
+sampling_seed = 0  # selects which swaps are sampled as migrating
 threshold_for_showing_probability = 0.5
 percentage_of_migration_from_uniswap = 50
-
-print("Probability of match after waiting", waiting_time, "blocks")
-
-# Loads the data according to the set parameters
-if use_dune_data:
-    swaps_by_block = read_swaps_from_csv(
-        'data/dune_download/merged.csv', consider_swaps_as_splitted_swaps, percentage_of_migration_from_uniswap)
+# if set, the swap store is evaluated in chunks of this many blocks, so that
+# block ranges that do not fit in memory can be used (block windows only)
+chunk_nr_blocks = None
+# if set, arbitrageurs of the chunked evaluation are found with a summary of
+# this many addresses instead of a counter per address (see heavy_hitters.py)
+heavy_hitters_capacity = None
+# if set, the results are saved there and reruns over an extended swap store
+# only process the new blocks (block windows only), reading chunk_nr_blocks
+# blocks at a time if set, or all of them at once
+results_dir = None
+# if set, probabilities are estimated from sampled blocks, until the
+# confidence interval of every pair is at most this wide (block windows only)
+confidence_interval_width = None
+# if True, the fraction of the volume of the orders that the volume of the
+# counter orders could match, instead of the probability of any counter
+# order (block windows, swap store only)
+volume_weighted = False
+
+# Only one of these evaluations can be selected (chunk_nr_blocks also sets
+# the chunks read by the one with results_dir).
+selected = [name for name, value in [
+    ('results_dir or chunk_nr_blocks', results_dir if results_dir is not None else chunk_nr_blocks),
+    ('waiting_time_in_seconds', waiting_time_in_seconds),
+    ('confidence_interval_width', confidence_interval_width),
+    ('volume_weighted', volume_weighted or None),
+] if value is not None]
+if len(selected) > 1:
+    raise ValueError(f"{' and '.join(selected)} cannot be combined.")
+if (results_dir is not None or chunk_nr_blocks is not None or volume_weighted) \
+        and not (use_dune_data and use_swap_store):
+    raise ValueError("results_dir, chunk_nr_blocks and volume_weighted need the swap store.")
+if heavy_hitters_capacity is not None and (chunk_nr_blocks is None or results_dir is not None):
+    raise ValueError("heavy_hitters_capacity is only used with chunk_nr_blocks, without results_dir.")
+
+if waiting_time_in_seconds is None:
+    print("Probability of match after waiting", waiting_time, "blocks")
 else:
-    swaps_by_block = get_swaps(use_cache, "data/uniswap_swaps.pickled")
-
-for block in range(min(swaps_by_block.keys()), max(swaps_by_block.keys())):
-    if block not in swaps_by_block.keys():
-        swaps_by_block[block] = []
-
-# filtering out arbitrageurs
-swaps_by_block = filter_out_arbitrageur_swaps(swaps_by_block)
-
-# sorts blocks
-sorted_blocks = sorted(swaps_by_block.keys(), reverse=True)
-
-# generates all possible pairs
-focus_pairs = generate_focus_pairs(sorted_blocks, swaps_by_block)
-
-# For each focus pair, it calculate the probability
-results = dict()
-for focus_pair in focus_pairs:
-    nr_of_times_an_order_can_be_found = 0
-    for block_index in range(len(sorted_blocks) - waiting_time):
-        if find_order_in_next_k_blocks(
-            block_index,
-            waiting_time,
-            focus_pair,
-            swaps_by_block,
-            sorted_blocks
-        ):
-            nr_of_times_an_order_can_be_found += 1
-
-    prob_opposite_offer = nr_of_times_an_order_can_be_found / \
-        (len(sorted_blocks) - waiting_time)
-    results["-".join(focus_pair)] = prob_opposite_offer
+    print("Probability of match after waiting", waiting_time_in_seconds, "seconds")
+
+error_bounds = None
+if use_dune_data and use_swap_store and results_dir is not None:
+    focus_pairs, probabilities = update_match_statistics(
+        SwapStore('data/dune_download/merged_store'), results_dir,
+        list(range(1, waiting_time + 1)), consider_swaps_as_splitted_swaps,
+        percentage_of_migration_from_uniswap, sampling_seed,
+        chunk_nr_blocks=chunk_nr_blocks)
+    waiting_times = list(range(1, waiting_time + 1))
+elif use_dune_data and use_swap_store and chunk_nr_blocks is not None:
+    # Reads the store one chunk of blocks at a time
+    store = SwapStore('data/dune_download/merged_store')
+    chunk_args = (consider_swaps_as_splitted_swaps, percentage_of_migration_from_uniswap, sampling_seed)
+    if heavy_hitters_capacity is None:
+        arbitrageurs = store_arbitrageurs(store, *chunk_args)
+    else:
+        arbitrageurs = sketch_arbitrageurs(store, heavy_hitters_capacity, *chunk_args)
+    focus_pairs = chunked_focus_pairs(store, chunk_nr_blocks, *chunk_args, arbitrageurs=arbitrageurs)
+    waiting_times = list(range(1, waiting_time + 1))
+    probabilities = chunked_match_probabilities(
+        store, focus_pairs, waiting_times, chunk_nr_blocks, *chunk_args, arbitrageurs=arbitrageurs)
+else:
+    # Loads the data according to the set parameters
+    if use_dune_data and use_swap_store:
+        dataset = SwapDataset.from_store(
+            SwapStore('data/dune_download/merged_store'), consider_swaps_as_splitted_swaps,
+            percentage_of_migration_from_uniswap, seed=sampling_seed)
+    elif use_dune_data:
+        dataset = SwapDataset.from_swaps_by_block(read_swaps_from_csv(
+            'data/dune_download/merged.csv', consider_swaps_as_splitted_swaps, percentage_of_migration_from_uniswap,
+            seed=sampling_seed))
+    else:
+        dataset = SwapDataset.from_swaps_by_block(
+            get_swaps(use_cache, "data/uniswap_swaps.pickled"))
+
+    # filtering out arbitrageurs
+    dataset = dataset.filter_out_arbitrageurs()
+
+    # generates all possible pairs
+    focus_pairs = dataset.focus_pairs()
+
+    # For each focus pair, it calculates the probability for all waiting
+    # times up to waiting_time at once
+    if waiting_time_in_seconds is None and confidence_interval_width is not None:
+        waiting_times = [waiting_time]
+        probabilities, error_bounds, _ = sampled_match_probabilities(
+            dataset, focus_pairs, waiting_time, confidence_interval_width, seed=sampling_seed)
+        probabilities = probabilities[:, None]
+    elif waiting_time_in_seconds is None and volume_weighted:
+        waiting_times = list(range(1, waiting_time + 1))
+        probabilities = volume_match_probabilities(dataset, focus_pairs, waiting_times)
+    elif waiting_time_in_seconds is None:
+        waiting_times = list(range(1, waiting_time + 1))
+        probabilities = match_probabilities(dataset, focus_pairs, waiting_times)
+    else:
+        waiting_times = [waiting_time_in_seconds]
+        probabilities = time_match_probabilities(dataset, focus_pairs, waiting_times)
+
+results = {
+    pair_label(focus_pair): probabilities[i, -1]
+    for i, focus_pair in enumerate(focus_pairs)
+}
 
 # prints the pairs meeting the threshold: threshold_for_showing_probability
 
 pairs_meeting_threshold = 0
-for (key, value) in results.items():
+for i, (key, value) in enumerate(results.items()):
     if value > threshold_for_showing_probability:
         print(key)
-        print(value)
+        if error_bounds is None:
+            print(value)
+        else:
+            print(value, "+-", error_bounds[i])
         pairs_meeting_threshold += 1
 
 print(pairs_meeting_threshold / len(focus_pairs),
@@ -98,4 +173,9 @@ for threshold in thresholds:
             pairs_meeting_threshold += 1
     print(threshold, ":", pairs_meeting_threshold)
 
+print("Number of pairs meeting the threshold of a",
+      threshold_for_showing_probability, "chance to find a match, by waiting time")
+for j, k in enumerate(waiting_times):
+    print(k, ":", int((probabilities[:, j] > threshold_for_showing_probability).sum()))
+
 plot_match_survivor(results)
@@ -13,68 +13,68 @@ p(counter_order_in_next_k_blocks, order_in_this_block) != \
     p(counter_order_in_next_k_blocks) * p(order_in_this_block)
 """
 
+import numpy as np
+
 from .download_swaps import get_swaps
-from .utils import find_order_in_block, find_order_in_next_k_blocks, filter_out_arbitrageur_swaps, plot_match_survivor, generate_focus_pairs
+from .match_probability import conditional_match_probabilities
+from .utils import plot_match_survivor, pair_label
 from .read_csv import read_swaps_from_csv
+from .swap_dataset import SwapDataset
+from .swap_store import SwapStore
 
 # Parameters
 use_dune_data = True
+use_swap_store = True  # create it with: python -m src.swap_store
 consider_swaps_as_splitted_swaps = True
 use_cache = True
 waiting_time = 4
+sampling_seed = 0  # selects which swaps are sampled as migrating
 threshold_for_showing_probability = 0.5
 assume_only_halve_of_trades_from_uniswap_is_migrating = True
 
 print("Probability of match after waiting", waiting_time, "blocks")
 
+percentage_of_migration_from_uniswap = \
+    50 if assume_only_halve_of_trades_from_uniswap_is_migrating else 100
+
 # Loads the data according to the set parameters
-if use_dune_data:
-    swaps_by_block = read_swaps_from_csv(
-        'data/dune_download/merged.csv', consider_swaps_as_splitted_swaps, assume_only_halve_of_trades_from_uniswap_is_migrating)
+if use_dune_data and use_swap_store:
+    dataset = SwapDataset.from_store(
+        SwapStore('data/dune_download/merged_store'), consider_swaps_as_splitted_swaps,
+        percentage_of_migration_from_uniswap, seed=sampling_seed)
+elif use_dune_data:
+    dataset = SwapDataset.from_swaps_by_block(read_swaps_from_csv(
+        'data/dune_download/merged.csv', consider_swaps_as_splitted_swaps, percentage_of_migration_from_uniswap,
+        seed=sampling_seed))
 else:
-    swaps_by_block = get_swaps(use_cache, "data/uniswap_swaps.pickled")
+    dataset = SwapDataset.from_swaps_by_block(
+        get_swaps(use_cache, "data/uniswap_swaps.pickled"))
 
+# blocks with swaps, before arbitrageurs are filtered out
+nr_blocks_with_swaps = np.count_nonzero(np.diff(dataset.block_offsets))
 
 # filtering out arbitrageurs
-swaps_by_block = filter_out_arbitrageur_swaps(swaps_by_block)
-
-# sorts blocks
-sorted_blocks = sorted(swaps_by_block.keys(), reverse=True)
+dataset = dataset.filter_out_arbitrageurs()
 
 # Sets a threshold for the minimum amount of appearances of a swap pair
 # Assuming a swap happens on average less frequently than in each 20ths block
 # the pair should not be relevant for our exchange
-threshold_for_min_nr_of_appearances_to_be_considered = len(sorted_blocks)/20
+threshold_for_min_nr_of_appearances_to_be_considered = nr_blocks_with_swaps/20
 
 # generates all possible pairs
-focus_pairs = generate_focus_pairs(sorted_blocks, swaps_by_block)
-
-
-# For each focus pair, it calculate the probability
-results = dict()
-for focus_pair in focus_pairs:
-    nr_of_times_an_order_can_be_found = 0
-    nr_of_times_a_counter_order_can_be_found_if_order_is_found = 0
-    for start_block_index in range(len(sorted_blocks) - waiting_time):
-        if not find_order_in_block(
-            sorted_blocks[start_block_index], focus_pair, swaps_by_block
-        ):
-            continue
-        nr_of_times_an_order_can_be_found += 1
-
-        nr_of_times_a_counter_order_can_be_found_if_order_is_found += \
-            find_order_in_next_k_blocks(
-                start_block_index,
-                waiting_time,
-                tuple(reversed(focus_pair)),
-                swaps_by_block,
-                sorted_blocks
-            )
-    prob_opposite_offer = nr_of_times_a_counter_order_can_be_found_if_order_is_found / \
-        nr_of_times_an_order_can_be_found \
-        if nr_of_times_an_order_can_be_found > \
-        threshold_for_min_nr_of_appearances_to_be_considered else 0
-    results["-".join(focus_pair)] = prob_opposite_offer
+focus_pairs = dataset.focus_pairs()
+
+
+# For each focus pair, it calculate the probability that an order of the
+# pair finds a counter order in its block or the next waiting_time - 1
+# blocks. Pairs below the threshold are skipped and get a probability of 0.
+probabilities = conditional_match_probabilities(
+    dataset, focus_pairs, [waiting_time],
+    threshold_for_min_nr_of_appearances_to_be_considered)
+results = {
+    pair_label(focus_pair): probabilities[i, 0]
+    for i, focus_pair in enumerate(focus_pairs)
+}
 
 # prints the pairs meeting the threshold: threshold_for_showing_probability
 
@@ -27,15 +27,26 @@ driver finds already a coincidence of wants or the order is about to
 expire (assuming a validity of waiting_time=x blocks).
 """
 
+import numpy as np
+
+from . import interning
 from .download_swaps import get_swaps
-from .utils import find_order_in_next_k_blocks, generate_focus_pairs, filter_out_arbitrageur_swaps, plot_match_survivor
+from .match_probability import match_probabilities, migration_sweep
+from .utils import plot_match_survivor, pair_label
 from .read_csv import read_swaps_from_csv
+from .swap_dataset import SwapDataset
+from .swap_store import SwapStore
 
 # Parameters
 use_dune_data = True
+# The store is opt-in, create it from the csv with:
+# python -m src.swap_store data/dune_download/swaps_data_from_router_11740000-11741000.csv \
+#     data/dune_download/swaps_data_from_router_11740000-11741000_store
+use_swap_store = False
 consider_swaps_as_splitted_swaps = True
 use_cache = True
 waiting_time = 4
+sampling_seed = 0  # selects which swaps are sampled as migrating
 threshold_for_showing_probability = 0.1
 
 # focus pair is a trade in direction WETH->USDC or WETH->DAI or WETH->USDT
@@ -43,53 +54,50 @@ focus_pairs = [('0xc02aaa39b223fe8d0a0e5c4f27ead9083c756cc2',  # WETH
                 '0xa0b86991c6218b36c1d19d4a2e9eb0ce3606eb48',  # USDC
                 '0x6b175474e89094c44da98b954eedeac495271d0f',  # DAI
                 '0xdac17f958d2ee523a2206206994597c13d831ec7')]  # USDT
+# datasets hold interned token ids
+focus_pairs = [tuple(interning.tokens.intern(t) for t in focus_pair)
+               for focus_pair in focus_pairs]
 
 print("Probability of match after waiting", waiting_time, "blocks")
 
 
 migration_percentages = [5, 10, 15, 20, 25, 30, 50]
+waiting_times = [waiting_time]
+
+# Loads the data according to the set parameters
+if use_dune_data and use_swap_store:
+    # A single load: the swaps migrating for a percentage p are the ones
+    # whose sampling key is below p, so all subsets come from this dataset.
+    dataset = SwapDataset.from_store(
+        SwapStore('data/dune_download/swaps_data_from_router_11740000-11741000_store'),
+        consider_swaps_as_splitted_swaps, seed=sampling_seed)
+    probabilities = migration_sweep(dataset, focus_pairs, migration_percentages, waiting_times)
+else:
+    probabilities = np.zeros((len(focus_pairs), len(migration_percentages), len(waiting_times)))
+    for j, migration_percentage in enumerate(migration_percentages):
+        if use_dune_data:
+            dataset = SwapDataset.from_swaps_by_block(read_swaps_from_csv(
+                'data/dune_download/swaps_data_from_router_11740000-11741000.csv', consider_swaps_as_splitted_swaps, migration_percentage,
+                seed=sampling_seed))
+        else:
+            dataset = SwapDataset.from_swaps_by_block(
+                get_swaps(use_cache, "data/uniswap_swaps.pickled"))
+
+        # filtering out arbitrageurs
+        dataset = dataset.filter_out_arbitrageurs()
+        probabilities[:, j, :] = match_probabilities(dataset, focus_pairs, waiting_times)
+
+# Probabilities indexed by (pair, migration percentage, waiting time)
+results = {
+    (pair_label(focus_pair), migration_percentage, k): probabilities[i, j, l]
+    for i, focus_pair in enumerate(focus_pairs)
+    for j, migration_percentage in enumerate(migration_percentages)
+    for l, k in enumerate(waiting_times)
+}
 
 for migration_percentage in migration_percentages:
     print("Probability with migration precentage of ", migration_percentage)
-
-    # Loads the data according to the set parameters
-    if use_dune_data:
-        swaps_by_block = read_swaps_from_csv(
-            'data/dune_download/swaps_data_from_router_11740000-11741000.csv', consider_swaps_as_splitted_swaps, migration_percentage)
-    else:
-        swaps_by_block = get_swaps(use_cache, "data/uniswap_swaps.pickled")
-
-    for block in range(min(swaps_by_block.keys()), max(swaps_by_block.keys())):
-        if block not in swaps_by_block.keys():
-            swaps_by_block[block] = []
-
-    # filtering out arbitrageurs
-    swaps_by_block = filter_out_arbitrageur_swaps(swaps_by_block)
-
-    # sorts blocks
-    sorted_blocks = sorted(swaps_by_block.keys(), reverse=True)
-
-    # For each focus pair, it calculate the probability
-    results = dict()
-    for focus_pair in focus_pairs:
-        nr_of_times_an_order_can_be_found = 0
-        for block_index in range(len(sorted_blocks) - waiting_time):
-            if find_order_in_next_k_blocks(
-                block_index,
-                waiting_time,
-                focus_pair,
-                swaps_by_block,
-                sorted_blocks
-            ):
-                nr_of_times_an_order_can_be_found += 1
-
-        prob_opposite_offer = nr_of_times_an_order_can_be_found / \
-            (len(sorted_blocks) - waiting_time)
-        results["-".join(focus_pair)] = prob_opposite_offer
-
-    # prints the pairs meeting the threshold: threshold_for_showing_probability
-    pairs_meeting_threshold = 0
-    for (key, value) in results.items():
-        print(key)
-        print(value)
-        pairs_meeting_threshold += 1
+    for ((pair, percentage, k), value) in results.items():
+        if percentage == migration_percentage and k == waiting_time:
+            print(pair)
+            print(value)
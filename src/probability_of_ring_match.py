@@ -0,0 +1,74 @@
+"""
+The following program calculates the probability of finding a match for a
+random order through a ring of orders, e.g. A->B matched by B->C and C->A,
+in addition to direct counter orders B->A.
+
+Formally, for rings of at most max_ring_length orders, it computes,
+p(ring_closing_orders_in_next_k_blocks | order_in_this_block)
+
+Like probability_of_match, the calculation makes the assumption that the
+appearance of an order and of the other orders of the ring is independent.
+"""
+
+from .download_swaps import get_swaps
+from .ring_match import ring_match_probabilities
+from .utils import pair_label
+from .read_csv import read_swaps_from_csv
+from .swap_dataset import SwapDataset
+from .swap_store import SwapStore
+
+# Parameters
+use_dune_data = True
+use_swap_store = True  # create it with: python -m src.swap_store
+consider_swaps_as_splitted_swaps = True
+use_cache = True
+waiting_time = 4
+max_ring_length = 3
+sampling_seed = 0  # selects which swaps are sampled as migrating
+threshold_for_showing_probability = 0.5
+percentage_of_migration_from_uniswap = 50
+nr_example_rings = 10
+
+print("Probability of match through rings of at most", max_ring_length,
+      "orders after waiting", waiting_time, "blocks")
+
+# Loads the data according to the set parameters
+if use_dune_data and use_swap_store:
+    dataset = SwapDataset.from_store(
+        SwapStore('data/dune_download/merged_store'), consider_swaps_as_splitted_swaps,
+        percentage_of_migration_from_uniswap, seed=sampling_seed)
+elif use_dune_data:
+    dataset = SwapDataset.from_swaps_by_block(read_swaps_from_csv(
+        'data/dune_download/merged.csv', consider_swaps_as_splitted_swaps, percentage_of_migration_from_uniswap,
+        seed=sampling_seed))
+else:
+    dataset = SwapDataset.from_swaps_by_block(
+        get_swaps(use_cache, "data/uniswap_swaps.pickled"))
+
+# filtering out arbitrageurs
+dataset = dataset.filter_out_arbitrageurs()
+
+# generates all possible pairs
+focus_pairs = dataset.focus_pairs()
+
+# Direct counter orders only, and rings up to max_ring_length orders
+direct_probabilities, _ = ring_match_probabilities(dataset, focus_pairs, waiting_time, 2)
+ring_probabilities, example_rings = ring_match_probabilities(
+    dataset, focus_pairs, waiting_time, max_ring_length)
+
+print("An overview of the number of pairs matchable with different thresholds")
+print("threshold : direct counter orders, rings")
+thresholds = [0.2, 0.3, 0.4, 0.5, 0.6]
+for threshold in thresholds:
+    print(threshold, ":", (direct_probabilities > threshold).sum(),
+          (ring_probabilities > threshold).sum())
+
+print("Pairs meeting the threshold of a", threshold_for_showing_probability,
+      "chance to find a match only through rings")
+for i, focus_pair in enumerate(focus_pairs):
+    if direct_probabilities[i] <= threshold_for_showing_probability < ring_probabilities[i]:
+        print(pair_label(focus_pair), direct_probabilities[i], ring_probabilities[i])
+
+print("Examples of rings")
+for i, (block, ring) in list(example_rings.items())[:nr_example_rings]:
+    print(block, pair_label(ring))
@@ -1,37 +1,59 @@
 import csv
-import ast
-from random import sample
 
+from .csv_index import open_block_range
+from .dune_csv import parse_address_array, parse_int_array
+from .sampling import is_sampled
+from . import interning
+from .records import Hop, Order
 
-def read_swaps_from_csv(filename, read_swaps_splitted=False, data_usage_percentage=50):
-    with open(filename, newline='') as f:
-        reader = csv.reader(f)
-        data = list(reader)
+
+def read_swaps_from_csv(filename, read_swaps_splitted=False, data_usage_percentage=50,
+                        intern=False, seed=0, from_block=None, to_block=None):
+    """If intern is True, tokens and addresses are replaced by their ids in
+    the interning.tokens and interning.addresses registries.
+
+    Only data_usage_percentage percent of the swaps are kept, chosen row by
+    row while reading (see sampling.py). The same seed selects the same
+    swaps on every run.
+
+    If given, only swaps with from_block <= block_number <= to_block are
+    read (see csv_index.py)."""
+    with open_block_range(filename, from_block, to_block) as lines:
+        reader = csv.reader(lines)
+        # Columns are located through the header, as in dune_csv.iter_swaps,
+        # so exports with other layouts or a block_time column are read too.
+        column = {name: i for i, name in enumerate(next(reader))}
+        block_column, index_column, path_column, address_column, amounts_column = (
+            column[name] for name in
+            ('block_number', 'index', 'path', 'address', 'output_amounts'))
         orders = dict()
-        data = sample(data[1:], len(data) * data_usage_percentage // 100)
-        for cnt, row in enumerate(data):
-            (block_number, index, gas_price, sell_amount,
-             buy_amount, path, address, output_amounts) = row
-            path = ast.literal_eval(path)
-            path = ['0x' + address for address in path]
-            output_amounts = ast.literal_eval(output_amounts.replace("L",""))
-            block_number = int(block_number)
+        for row in reader:
+            block_number = int(row[block_column])
+            if not is_sampled(seed, block_number, int(row[index_column]), data_usage_percentage):
+                continue
+            path = parse_address_array(row[path_column])
+            address = row[address_column]
+            output_amounts = parse_int_array(row[amounts_column])
+            if intern:
+                path = [interning.tokens.intern(t) for t in path]
+                address = interning.addresses.intern(address)
             entry = orders[block_number] if block_number in \
                 orders else list()
             if read_swaps_splitted:
-                for sell_token, buy_token in zip(path, path[1:]):
+                for hop, (sell_token, buy_token) in enumerate(zip(path, path[1:])):
                     entry.append(
-                        {"sellToken": sell_token,
-                         "buyToken": buy_token,
-                         "amounts": output_amounts,
-                         "address": address,
-                         "block": block_number})
+                        Hop(sellToken=sell_token,
+                            buyToken=buy_token,
+                            amounts=output_amounts,
+                            address=address,
+                            block=block_number,
+                            hop=hop))
             else:
                 entry.append(
-                    {"sellToken": path[0],
-                     'buyToken': path[-1],
-                     'address': address,
-                     "amounts": output_amounts,
-                     "block": block_number})
+                    Order(sellToken=path[0],
+                          buyToken=path[-1],
+                          address=address,
+                          amounts=output_amounts,
+                          block=block_number))
             orders[block_number] = entry
         return orders
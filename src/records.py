@@ -0,0 +1,106 @@
+"""
+Compact record types for swaps and orders.
+
+Holding a dict per swap (or per hop) costs a hash table with its own copy
+of the key pointers for every record. These classes store the same fields
+in __slots__ instead, and still support the dict-style access
+(record['sellToken'], record['amm_balances'] = ...) used throughout the
+scripts. Hops of the same swap share its output_amounts list.
+
+As with a dict, a field that was never set is not in the record (even if
+others are set to None), and reading it raises KeyError. Records are
+mutable, so they compare and hash by identity; compare record.to_dict()
+to compare their fields.
+"""
+
+
+class Record:
+    __slots__ = ()
+
+    def __init__(self, **fields):
+        unknown = [name for name in fields if name not in self.__slots_all__]
+        if len(unknown) > 0:
+            raise TypeError(f"Unknown {type(self).__name__} fields: {unknown}")
+        for name, value in fields.items():
+            setattr(self, name, value)
+
+    def __init_subclass__(cls):
+        cls.__slots_all__ = tuple(
+            name for c in reversed(cls.__mro__) for name in getattr(c, '__slots__', ())
+        )
+
+    @classmethod
+    def from_row(cls, row):
+        """Record of the fields of a dict, e.g. a parsed csv row. Columns
+        that are not fields of the record are ignored."""
+        return cls(**{k: v for k, v in row.items() if k in cls.__slots_all__})
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        try:
+            setattr(self, key, value)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __delitem__(self, key):
+        try:
+            delattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.__slots_all__ and hasattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self else default
+
+    def keys(self):
+        return [k for k in self.__slots_all__ if hasattr(self, k)]
+
+    def to_dict(self):
+        return {k: getattr(self, k) for k in self.keys()}
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()})"
+
+
+class Order(Record):
+    """A swap seen as an order from its first to its last token."""
+    __slots__ = ('sellToken', 'buyToken', 'address', 'amounts', 'block')
+
+    @property
+    def sellAmount(self):
+        return self.amounts[0]
+
+    @property
+    def buyAmount(self):
+        return self.amounts[-1]
+
+
+class Hop(Order):
+    """A single hop, path[hop] -> path[hop + 1], of a routed swap."""
+    __slots__ = ('hop',)
+
+    @property
+    def sellAmount(self):
+        return self.amounts[self.hop]
+
+    @property
+    def buyAmount(self):
+        return self.amounts[self.hop + 1]
+
+
+class Swap(Record):
+    """A routed swap as exported from Dune, plus the data added by create_oba."""
+    __slots__ = (
+        'block_number', 'index', 'gas_price', 'sell_amount', 'buy_amount',
+        'path', 'output_amounts', 'block_time', 'address',
+        'amm_balances', 'human_amounts',
+        'from_token_day_price_usd', 'to_token_day_price_usd',
+        'from_token_price_eth', 'to_token_price_eth'
+    )
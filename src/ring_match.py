@@ -0,0 +1,154 @@
+"""
+Matching orders through rings of orders, e.g. A->B, B->C and C->A.
+
+find_order_in_block only finds direct counter orders (B->A for an order
+A->B). An order A->B can also be matched by a ring of live orders
+B->C, C->A, or longer ones, which a batch auction settles as well. This
+module slides a window of waiting_time blocks over a SwapDataset and keeps
+the directed token graph of the orders in the window up to date as blocks
+enter and leave it. The graph is stored as adjacency bitsets (python ints,
+bit t of out_edges[s] is set if a live order sells s for t), so the
+tokens reachable from B in at most max_ring_length - 1 orders are found
+with a few ORs over the bitsets.
+"""
+
+import numpy as np
+
+
+def _bits(bitset):
+    while bitset:
+        low = bitset & -bitset
+        yield low.bit_length() - 1
+        bitset ^= low
+
+
+class TokenGraph:
+    """Directed token graph of a multiset of orders."""
+
+    def __init__(self):
+        self.edge_counts = dict()
+        self.out_edges = dict()
+        # Incremented whenever an edge appears or disappears.
+        self.version = 0
+
+    def add(self, sell_token, buy_token):
+        count = self.edge_counts.get((sell_token, buy_token), 0)
+        if count == 0:
+            self.out_edges[sell_token] = self.out_edges.get(sell_token, 0) | (1 << buy_token)
+            self.version += 1
+        self.edge_counts[(sell_token, buy_token)] = count + 1
+
+    def remove(self, sell_token, buy_token):
+        count = self.edge_counts.pop((sell_token, buy_token)) - 1
+        if count > 0:
+            self.edge_counts[(sell_token, buy_token)] = count
+            return
+        out_edges = self.out_edges[sell_token] & ~(1 << buy_token)
+        if out_edges:
+            self.out_edges[sell_token] = out_edges
+        else:
+            del self.out_edges[sell_token]
+        self.version += 1
+
+    def reachable(self, source, max_nr_orders):
+        """Bitset of the tokens reachable from source through at most
+        max_nr_orders orders."""
+        reach = frontier = self.out_edges.get(source, 0)
+        for _ in range(max_nr_orders - 1):
+            next_frontier = 0
+            for t in _bits(frontier):
+                next_frontier |= self.out_edges.get(t, 0)
+            frontier = next_frontier & ~reach
+            if not frontier:
+                break
+            reach |= frontier
+        return reach
+
+    def find_path(self, source, target, max_nr_orders):
+        """Shortest list of tokens [source, ..., target] of a path of at
+        most max_nr_orders orders, or None."""
+        parents = {source: None}
+        frontier = [source]
+        for _ in range(max_nr_orders):
+            next_frontier = []
+            for s in frontier:
+                for t in _bits(self.out_edges.get(s, 0)):
+                    # target can be the source itself, for the pairs of
+                    # swaps buying back the token they sell
+                    if t == target:
+                        path = [s]
+                        while parents[path[-1]] is not None:
+                            path.append(parents[path[-1]])
+                        return path[::-1] + [t]
+                    if t in parents:
+                        continue
+                    parents[t] = s
+                    next_frontier.append(t)
+            frontier = next_frontier
+        return None
+
+
+def ring_match_probabilities(dataset, focus_pairs, waiting_time, max_ring_length=3):
+    """Probability that an order of each focus pair (A, B), i.e. selling A
+    for B, placed at a block is matched by a ring of at most
+    max_ring_length orders (itself included) closed by the orders of the
+    following waiting_time blocks.
+
+    With max_ring_length = 2 only direct counter orders count, which is
+    match_probability.match_probabilities for the same windows.
+
+    Returns (probabilities, example_rings), where example_rings maps the
+    index of a pair matched only through a longer ring to the first
+    (block of the order, ring) found, ring being the list of tokens
+    [A, B, ..., A].
+    """
+    pair_index = {tuple(p): i for i, p in enumerate(focus_pairs)}
+    sources = sorted({p[1] for p in focus_pairs})
+    sell_tokens = dataset.sell_token.tolist()
+    buy_tokens = dataset.buy_token.tolist()
+    offsets = dataset.block_offsets.tolist()
+    graph = TokenGraph()
+
+    def add_block(pos):
+        for row in range(offsets[pos], offsets[pos + 1]):
+            graph.add(sell_tokens[row], buy_tokens[row])
+
+    def remove_block(pos):
+        for row in range(offsets[pos], offsets[pos + 1]):
+            graph.remove(sell_tokens[row], buy_tokens[row])
+
+    def matched_pairs(block_pos):
+        matched = []
+        for b in sources:
+            if b not in graph.out_edges:
+                continue
+            for a in _bits(graph.reachable(b, max_ring_length - 1)):
+                i = pair_index.get((a, b))
+                if i is None:
+                    continue
+                matched.append(i)
+                if i not in example_rings and not (graph.out_edges[b] >> a) & 1:
+                    example_rings[i] = (
+                        dataset.first_block + block_pos,
+                        [a] + graph.find_path(b, a, max_ring_length - 1))
+        return matched
+
+    nr_orders = dataset.nr_blocks - waiting_time
+    hits = np.zeros(len(focus_pairs), dtype=np.int64)
+    example_rings = dict()
+    # The window of an order placed at block p has the blocks
+    # p + 1 .. p + waiting_time. Windows with the same graph have the
+    # same matched pairs, which are only found again when it changes.
+    for pos in range(1, min(waiting_time + 1, dataset.nr_blocks)):
+        add_block(pos)
+    matched, nr_windows, version = [], 0, None
+    for p in range(nr_orders):
+        if p > 0:
+            remove_block(p)
+            add_block(p + waiting_time)
+        if graph.version != version:
+            hits[matched] += nr_windows
+            matched, nr_windows, version = matched_pairs(p), 0, graph.version
+        nr_windows += 1
+    hits[matched] += nr_windows
+    return hits / nr_orders, example_rings
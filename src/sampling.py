@@ -0,0 +1,47 @@
+"""
+Reproducible Bernoulli sampling of swaps.
+
+Every swap gets a pseudo random key in [0, 1) computed by hashing the seed
+together with its (block_number, index). A swap is kept when its key is
+below the sampled fraction, so the decision is taken row by row while
+streaming, the same seed always selects the same swaps whatever the order
+or the file they are read from, and the sample of a smaller fraction is a
+subset of the sample of a larger one.
+"""
+
+import numpy as np
+
+MASK64 = (1 << 64) - 1
+
+
+def _mix(z):
+    # splitmix64 finalizer
+    z = ((z ^ (z >> 30)) * 0xbf58476d1ce4e5b9) & MASK64
+    z = ((z ^ (z >> 27)) * 0x94d049bb133111eb) & MASK64
+    return z ^ (z >> 31)
+
+
+def sample_key(seed, block_number, index):
+    z = _mix((seed * 0x9e3779b97f4a7c15 + block_number) & MASK64)
+    z = _mix((z + index) & MASK64)
+    return (z >> 11) * 2.0 ** -53
+
+
+def _mix_array(z):
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+    return z ^ (z >> np.uint64(31))
+
+
+def sample_keys(seed, block_numbers, indexes):
+    """Vectorized sample_key."""
+    with np.errstate(over='ignore'):
+        z = np.uint64((seed * 0x9e3779b97f4a7c15) & MASK64) + \
+            np.asarray(block_numbers).astype(np.uint64)
+        z = _mix_array(z)
+        z = _mix_array(z + np.asarray(indexes).astype(np.uint64))
+    return (z >> np.uint64(11)) * 2.0 ** -53
+
+
+def is_sampled(seed, block_number, index, data_usage_percentage):
+    return sample_key(seed, block_number, index) * 100 < data_usage_percentage
@@ -0,0 +1,288 @@
+"""
+Online estimation of the probability of match over a live feed of swaps.
+
+Swaps are read from a csv in the Dune export format (see dune_csv.py),
+either a file that keeps growing (followed like tail -f) or a pipe, and
+consumed one block at a time. A block is complete once a swap of a later
+block arrives, or the feed ends.
+
+As in match_probability.py, an order of focus pair (A, B) placed at block
+p is matched if a counter order, buying A and selling B, is in one of the
+blocks p + 1 .. p + waiting_time, and focus pairs are the (sell token, buy
+token) pairs of the orders seen, as utils.generate_focus_pairs builds
+them. For every pair, the estimator keeps the block of its last counter
+order and the intervals of order blocks that a counter order matched.
+When a block arrives, only the pairs with a counter order in it are
+updated (the orders of the waiting_time blocks before it become matched),
+so the work per block is proportional to its number of orders, and the
+probability of a pair is read in O(waiting_time).
+
+Memory per pair is bounded by the intervals that can still change the
+probability: those reaching the last waiting_time blocks, plus, with a
+history, the ones inside the history (about history_nr_blocks / 2 at
+most, since contiguous intervals are merged).
+
+Probabilities are over the orders placed in the last history_nr_blocks
+blocks whose window is complete, or since the start of the feed if
+history_nr_blocks is not given; in the latter case they are equal to
+match_probabilities over the same blocks at the end of the feed.
+
+Orders of arbitrageurs can be left out, as they are found: addresses
+with more than max_amount_swaps_retail_traders orders in the last blocks
+are tracked with a bounded memory summary (see heavy_hitters.py).
+
+Usage:
+tail -f data/dune_download/live.csv | python -m src.streaming_match_probability -
+python -m src.streaming_match_probability data/dune_download/live.csv --follow
+"""
+
+import argparse
+import sys
+import time
+from collections import deque
+
+from . import interning
+from .dune_csv import iter_swaps
+from .heavy_hitters import SlidingHeavyHitters
+from .sampling import is_sampled
+from .utils import pair_label
+
+
+def follow(f, poll_interval=1.0):
+    """Yield the lines of a file, waiting for new ones at its end, as
+    tail -f does. Lines are only yielded once they are complete."""
+    partial = ''
+    while True:
+        line = f.readline()
+        if line == '':
+            time.sleep(poll_interval)
+            continue
+        partial += line
+        if partial.endswith('\n'):
+            yield partial
+            partial = ''
+
+
+def iter_blocks(swaps):
+    """Group a stream of swaps sorted by block into (block_number, swaps)
+    tuples, each one yielded as soon as the next block starts."""
+    block_number, block_swaps = None, []
+    for swap in swaps:
+        if swap['block_number'] != block_number:
+            if block_number is not None:
+                yield block_number, block_swaps
+            block_number, block_swaps = swap['block_number'], []
+        block_swaps.append(swap)
+    if block_number is not None:
+        yield block_number, block_swaps
+
+
+def block_orders(swaps, split=True, data_usage_percentage=100, seed=0):
+    """(sell token, buy token, address) of the orders of the swaps, as
+    interning ids, sampled and split as read_swaps_from_csv does."""
+    orders = []
+    for swap in swaps:
+        if not is_sampled(seed, swap['block_number'], swap['index'], data_usage_percentage):
+            continue
+        path = [interning.tokens.intern(t) for t in swap['path']]
+        address = interning.addresses.intern(swap['address'])
+        if split:
+            orders.extend((s, b, address) for s, b in zip(path, path[1:]))
+        else:
+            orders.append((path[0], path[-1], address))
+    return orders
+
+
+class StreamingMatchEstimator:
+    """Sliding window counters of the orders matched by a counter order
+    within waiting_time blocks, for every (sell token, buy token) pair."""
+
+    def __init__(self, waiting_time, history_nr_blocks=None):
+        self.waiting_time = waiting_time
+        self.history_nr_blocks = history_nr_blocks
+        self.first_block = None
+        self.last_block = None
+        # Disjoint, increasing intervals [lo, hi] of the order blocks
+        # matched by a counter order of the pair, and their total length.
+        self.matched = dict()
+        self.nr_matched = dict()
+        self.last_counter_block = dict()
+        # Last block before the last one with an order of every pair, and
+        # the pairs of the orders of the last block.
+        self.last_order_block = dict()
+        self.last_block_pairs = set()
+
+    def first_order_block(self):
+        """First block of the orders the probabilities are over."""
+        if self.history_nr_blocks is None:
+            return self.first_block
+        return max(self.first_block,
+                   self.last_block - self.waiting_time - self.history_nr_blocks + 1)
+
+    def nr_orders(self):
+        """Number of blocks where orders with a complete window are placed."""
+        if self.last_block is None:
+            return 0
+        return max(self.last_block - self.waiting_time - self.first_order_block() + 1, 0)
+
+    def _expire(self, pair):
+        intervals = self.matched[pair]
+        if self.history_nr_blocks is None:
+            # Without a history, the intervals of orders whose window is
+            # complete are never subtracted again, and only kept counted
+            # in nr_matched.
+            last = self.last_block - self.waiting_time
+            while intervals and intervals[0][1] <= last:
+                intervals.popleft()
+            return
+        first = self.first_order_block()
+        while intervals and intervals[0][1] < first:
+            lo, hi = intervals.popleft()
+            self.nr_matched[pair] -= hi - lo + 1
+
+    def add_block(self, block_number, orders):
+        """Count the (sell token, buy token, ...) orders of the next block.
+        Blocks without orders in between are implied by the block number."""
+        if self.first_block is None:
+            self.first_block = block_number
+        assert self.last_block is None or block_number > self.last_block, \
+            "Blocks must be added in increasing order."
+        for pair in self.last_block_pairs:
+            self.last_order_block[pair] = self.last_block
+        self.last_block = block_number
+        self.last_block_pairs = {(o[0], o[1]) for o in orders}
+        # An order of pair (A, B) is a counter order of the pair (B, A).
+        for pair in {(o[1], o[0]) for o in orders}:
+            if pair not in self.matched:
+                self.matched[pair] = deque()
+                self.nr_matched[pair] = 0
+            # Orders of the previous waiting_time blocks, not matched yet:
+            # the ones placed from the block of the last counter order on
+            # (the orders of a block are not matched within it).
+            lo = max(self.last_counter_block.get(pair, self.first_block),
+                     block_number - self.waiting_time, self.first_block)
+            if lo < block_number:
+                intervals = self.matched[pair]
+                if intervals and intervals[-1][1] + 1 == lo:
+                    intervals[-1][1] = block_number - 1
+                else:
+                    intervals.append([lo, block_number - 1])
+                self.nr_matched[pair] += block_number - lo
+            self.last_counter_block[pair] = block_number
+            self._expire(pair)
+
+    def probability(self, pair):
+        nr_orders = self.nr_orders()
+        if nr_orders == 0 or pair not in self.matched:
+            return 0.0
+        self._expire(pair)
+        first = self.first_order_block()
+        last = self.last_block - self.waiting_time
+        nr_matched = self.nr_matched[pair]
+        # Only the intervals of the last waiting_time blocks reach orders
+        # whose window is not complete yet.
+        for lo, hi in reversed(self.matched[pair]):
+            if hi <= last:
+                break
+            nr_matched -= hi - max(lo, last + 1) + 1
+        intervals = self.matched[pair]
+        if intervals and intervals[0][0] < first <= intervals[0][1]:
+            nr_matched -= first - intervals[0][0]
+        return nr_matched / nr_orders
+
+    def focus_pairs(self):
+        """Pairs with an order in the history, ignoring the first and the
+        last block as utils.generate_focus_pairs does."""
+        first = max(self.first_order_block(), self.first_block + 1)
+        return [pair for pair, block in self.last_order_block.items() if block >= first]
+
+    def probabilities(self):
+        """Probability of every focus pair, as a dict."""
+        return {pair: self.probability(pair) for pair in self.focus_pairs()}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Probability of match of every pair, updated at every block of a live swap feed.')
+
+    parser.add_argument(
+        'input',
+        type=str,
+        help="Csv file in the Dune export format, or - to read it from the standard input."
+    )
+    parser.add_argument(
+        '--follow',
+        action='store_true',
+        help="Wait for new swaps at the end of the file, as tail -f does."
+    )
+    parser.add_argument(
+        '--poll_interval',
+        type=float,
+        default=1.0,
+        help="Seconds between reads at the end of a followed file."
+    )
+    parser.add_argument(
+        '--waiting_time',
+        type=int,
+        default=4,
+        help="Number of blocks an order waits for a counter order."
+    )
+    parser.add_argument(
+        '--history_nr_blocks',
+        type=int,
+        default=None,
+        help="Only count the orders of this many last blocks (all of them by default)."
+    )
+    parser.add_argument(
+        '--data_usage_percentage',
+        type=float,
+        default=100,
+        help="Percentage of the swaps migrating from uniswap."
+    )
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=0,
+        help="Selects which swaps are sampled as migrating."
+    )
+    parser.add_argument(
+        '--whole_swaps',
+        action='store_true',
+        help="Do not split swaps into one order per hop."
+    )
+    parser.add_argument(
+        '--max_amount_swaps_retail_traders',
+        type=int,
+        default=None,
+        help="Leave out the orders of addresses with more orders (none are left out by default)."
+    )
+    parser.add_argument(
+        '--arbitrageur_window_nr_blocks',
+        type=int,
+        default=None,
+        help="Count the orders of every address over this many last blocks (all of them by default)."
+    )
+    parser.add_argument(
+        '--heavy_hitters_capacity',
+        type=int,
+        default=10000,
+        help="Number of addresses tracked to find arbitrageurs."
+    )
+
+    args = parser.parse_args()
+
+    f = sys.stdin if args.input == '-' else open(args.input, 'r')
+    lines = follow(f, args.poll_interval) if args.follow else f
+    estimator = StreamingMatchEstimator(args.waiting_time, args.history_nr_blocks)
+    heavy_hitters = SlidingHeavyHitters(args.arbitrageur_window_nr_blocks, args.heavy_hitters_capacity)
+    # Prints, at every block, the probability of the pairs traded in it.
+    for block_number, swaps in iter_blocks(iter_swaps(lines)):
+        orders = block_orders(swaps, not args.whole_swaps, args.data_usage_percentage, args.seed)
+        if args.max_amount_swaps_retail_traders is not None:
+            heavy_hitters.add_block(block_number, [o[2] for o in orders])
+            orders = [o for o in orders if not heavy_hitters.is_heavy_hitter(
+                o[2], args.max_amount_swaps_retail_traders)]
+        estimator.add_block(block_number, orders)
+        for pair in sorted({(o[0], o[1]) for o in orders}):
+            print(block_number, pair_label(pair), estimator.probability(pair), sep='\t')
+        sys.stdout.flush()
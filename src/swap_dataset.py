@@ -0,0 +1,265 @@
+"""
+Orders loaded from a swap store as flat arrays over a dense block axis.
+
+Every order (a whole swap, or a single hop of it if swaps are split) is a
+row of the arrays below, and rows are sorted by block. The block axis
+holds every block between the first and the last one, with or without
+orders, and the orders of the i-th block of the axis are the rows
+
+    block_offsets[i]:block_offsets[i + 1]
+
+so looking up the orders of a block is an O(1) slice, and there is no need
+to fill in empty blocks or to sort them.
+
+Tokens and addresses are ids of the shared interning registries.
+
+Every order also keeps the sampling key of its swap (see sampling.py), so
+the orders of any migration percentage p are the nested subset
+sample(p) of a single loaded dataset.
+
+If the swaps were exported with their block_time, block_times holds the
+timestamp of every block of the axis (interpolated for the blocks without
+swaps), which is sorted, so time windows are found by binary search.
+"""
+
+import numpy as np
+
+from . import interning
+from .sampling import sample_keys
+
+
+def _block_times_of_axis(blocks, block_times, first_block, nr_blocks):
+    """Timestamps of the blocks of an axis from the ones of its swaps, or
+    None if none of the swaps has one."""
+    known = block_times >= 0
+    if not np.any(known):
+        return None
+    blocks, first = np.unique(np.asarray(blocks)[known], return_index=True)
+    return np.interp(
+        np.arange(first_block, first_block + nr_blocks), blocks,
+        np.asarray(block_times)[known][first]
+    )
+
+
+def arbitrageur_mask(counts, max_amount_swaps_retail_traders=50,
+                     fraction_to_remove=None):
+    """Which addresses are arbitrageurs, given the number of orders of
+    every address id, with the criteria of utils.find_arbitrageurs."""
+    if fraction_to_remove is None:
+        return counts > max_amount_swaps_retail_traders
+    nr_to_remove = round(np.count_nonzero(counts) * fraction_to_remove)
+    is_arbitrageur = np.zeros(len(counts), dtype=bool)
+    is_arbitrageur[np.argsort(-counts, kind='stable')[:nr_to_remove]] = True
+    return is_arbitrageur
+
+
+def store_rows(store, from_block=None, to_block=None):
+    """First and last (excluded) row of the swaps of a store in the block
+    range from_block .. to_block (the whole store if not given)."""
+    first_row = 0 if from_block is None else \
+        int(np.searchsorted(store.block, from_block, side='left'))
+    last_row = len(store) if to_block is None else \
+        int(np.searchsorted(store.block, to_block, side='right'))
+    return first_row, last_row
+
+
+class SwapDataset:
+
+    def __init__(self, first_block, nr_blocks, block, sell_token, buy_token,
+                 address, key=None, swap=None, sell_amount_index=None,
+                 buy_amount_index=None, store=None, block_times=None):
+        self.first_block = first_block
+        self.nr_blocks = nr_blocks
+        # Per order arrays, sorted by block.
+        self.block = block
+        self.sell_token = sell_token
+        self.buy_token = buy_token
+        self.address = address
+        # Sampling key of the order's swap, in [0, 1).
+        self.key = key if key is not None else np.zeros(len(block))
+        # Row of the order's swap in the store, and rows of its sold and
+        # bought amounts in store.amounts.
+        self.swap = swap
+        self.sell_amount_index = sell_amount_index
+        self.buy_amount_index = buy_amount_index
+        self.store = store
+        self.block_times = block_times
+        self.block_offsets = np.searchsorted(
+            block, np.arange(first_block, first_block + nr_blocks + 1)
+        )
+
+    @classmethod
+    def from_store(cls, store, split=False, data_usage_percentage=100, seed=0,
+                   from_block=None, to_block=None):
+        """Load the orders of a swap store, in the given block range.
+
+        data_usage_percentage and seed sample swaps as read_swaps_from_csv
+        does, and split has the meaning of its read_swaps_splitted.
+        """
+        first_row, last_row = store_rows(store, from_block, to_block)
+        if from_block is None:
+            from_block = int(store.block[0]) if len(store) > 0 else 0
+        if to_block is None:
+            to_block = int(store.block[-1]) if len(store) > 0 else -1
+        block_times = None
+        if store.block_time is not None:
+            block_times = _block_times_of_axis(
+                store.block[first_row:last_row], store.block_time[first_row:last_row],
+                from_block, to_block - from_block + 1)
+        rows = np.arange(first_row, last_row)
+        keys = sample_keys(seed, store.block[first_row:last_row], store.index[first_row:last_row])
+        if data_usage_percentage < 100:
+            sampled = keys * 100 < data_usage_percentage
+            rows = rows[sampled]
+            keys = keys[sampled]
+
+        hop_offsets = np.asarray(store.hop_offsets)
+        if split:
+            nr_hops = hop_offsets[rows + 1] - hop_offsets[rows] - 1
+            swap = np.repeat(rows, nr_hops)
+            keys = np.repeat(keys, nr_hops)
+            first_hop = np.repeat(hop_offsets[rows], nr_hops)
+            hop = np.arange(len(swap)) - np.repeat(np.cumsum(nr_hops) - nr_hops, nr_hops)
+            sell_amount_index = first_hop + hop
+            buy_amount_index = sell_amount_index + 1
+        else:
+            swap = rows
+            sell_amount_index = hop_offsets[rows]
+            buy_amount_index = hop_offsets[rows + 1] - 1
+
+        token_ids, address_ids = store.interned_ids()
+        block = np.asarray(store.block[swap])
+        order = np.argsort(block, kind='stable')  # no-op for sorted stores
+        swap = swap[order]
+        sell_amount_index = sell_amount_index[order]
+        buy_amount_index = buy_amount_index[order]
+        return cls(
+            from_block, to_block - from_block + 1,
+            block=block[order],
+            sell_token=token_ids[store.hop_tokens[sell_amount_index]],
+            buy_token=token_ids[store.hop_tokens[buy_amount_index]],
+            address=address_ids[store.address[swap]],
+            key=keys[order],
+            swap=swap,
+            sell_amount_index=sell_amount_index,
+            buy_amount_index=buy_amount_index,
+            store=store,
+            block_times=block_times
+        )
+
+    @classmethod
+    def from_swaps_by_block(cls, swaps_by_block):
+        """Dataset of the orders of a dict block -> list of orders, e.g. as
+        returned by download_swaps.get_swaps.
+
+        These orders have no sampling key, and are part of every sample.
+        Orders without an address (as the ones of thegraph) get the
+        address id -1.
+        """
+        blocks = sorted(swaps_by_block.keys())
+        orders = [(b, o) for b in blocks for o in swaps_by_block[b]]
+        tokens = interning.tokens
+        addresses = interning.addresses
+        return cls(
+            blocks[0], blocks[-1] - blocks[0] + 1,
+            block=np.array([b for b, _ in orders], dtype=np.int64),
+            sell_token=np.array([tokens.intern(o['sellToken']) for _, o in orders], dtype=np.int32),
+            buy_token=np.array([tokens.intern(o['buyToken']) for _, o in orders], dtype=np.int32),
+            address=np.array([addresses.intern(o['address']) if 'address' in o else -1
+                              for _, o in orders], dtype=np.int32)
+        )
+
+    def __len__(self):
+        return len(self.block)
+
+    @property
+    def blocks(self):
+        """The block axis."""
+        return np.arange(self.first_block, self.first_block + self.nr_blocks)
+
+    @property
+    def block_positions(self):
+        """Position on the block axis of the block of every order."""
+        return self.block - self.first_block
+
+    def orders_in_block(self, block_pos):
+        """Rows of the orders of the block at position block_pos of the axis."""
+        return slice(self.block_offsets[block_pos], self.block_offsets[block_pos + 1])
+
+    def select(self, mask):
+        """Dataset with the orders in mask, over the same block axis."""
+        def sel(a):
+            return a[mask] if a is not None else None
+        return SwapDataset(
+            self.first_block, self.nr_blocks, self.block[mask],
+            self.sell_token[mask], self.buy_token[mask], self.address[mask],
+            self.key[mask], sel(self.swap), sel(self.sell_amount_index),
+            sel(self.buy_amount_index), self.store, self.block_times
+        )
+
+    def sample(self, data_usage_percentage):
+        """Orders of the swaps sampled with data_usage_percentage, as
+        data_usage_percentage would select them at load."""
+        return self.select(self.key * 100 < data_usage_percentage)
+
+    def filter_out_arbitrageurs(self, max_amount_swaps_retail_traders=50,
+                                verbose=True, fraction_to_remove=None):
+        """Same as utils.filter_out_arbitrageur_swaps: the orders of every
+        address are counted once, and removed at once with a mask.
+
+        Orders without an address are never removed, and if no order has
+        one, nothing is filtered out."""
+        if verbose:
+            print("Before filtering out arbitrageurs, the data contains ",
+                  len(self), " swaps")
+        has_address = self.address >= 0
+        if not np.any(has_address):
+            print("The orders have no address, arbitrageurs are not filtered out.")
+            return self
+        is_arbitrageur = arbitrageur_mask(
+            np.bincount(self.address[has_address]), max_amount_swaps_retail_traders,
+            fraction_to_remove)
+        r = self.select(~(has_address & is_arbitrageur[np.maximum(self.address, 0)]))
+        if verbose:
+            print("After filtering out arbitrageurs, the data contains ",
+                  len(r), " swaps")
+        return r
+
+    def exclude_addresses(self, addresses):
+        """Dataset without the orders of the given addresses."""
+        return self.select(~np.isin(self.address, addresses))
+
+    def focus_pairs(self):
+        """All distinct (sell_token, buy_token) pairs, ignoring the first and
+        last block of the axis as utils.generate_focus_pairs does."""
+        rows = slice(self.block_offsets[1], self.block_offsets[max(self.nr_blocks - 1, 1)])
+        pairs = np.unique(np.stack([self.sell_token[rows], self.buy_token[rows]], axis=1), axis=0)
+        return [tuple(p) for p in pairs.tolist()]
+
+    def amounts(self):
+        """(sold, bought) amount of every order, as raw token amounts in
+        float64."""
+        if self.store is None or self.store.amounts is None:
+            raise ValueError(
+                "The dataset has no amounts: load it from a swap store "
+                "created with output amounts.")
+        return (self.store.amounts[self.sell_amount_index].to_float(),
+                self.store.amounts[self.buy_amount_index].to_float())
+
+    def find_order_in_block(self, block_pos, focus_pair):
+        """Same as utils.find_order_in_block, for a position of the block axis."""
+        rows = self.orders_in_block(block_pos)
+        return bool(np.any(
+            (self.buy_token[rows] == focus_pair[0]) &
+            np.isin(self.sell_token[rows], focus_pair[1:4])
+        ))
+
+    def find_order_in_next_k_blocks(self, start_block_pos, k, focus_pair):
+        """Same as utils.find_order_in_next_k_blocks, for the k blocks of
+        the axis starting at start_block_pos."""
+        rows = slice(self.block_offsets[start_block_pos],
+                     self.block_offsets[min(start_block_pos + k, self.nr_blocks)])
+        return bool(np.any(
+            (self.buy_token[rows] == focus_pair[0]) &
+            np.isin(self.sell_token[rows], focus_pair[1:4])
+        ))
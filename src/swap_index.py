@@ -0,0 +1,159 @@
+"""
+Secondary indexes over the orders of a SwapDataset.
+
+utils.find_order_in_block and friends scan the orders to answer every
+question, and so does every filtered list built on top of them, e.g. the
+WETH/USDC orders of a block range. A SwapIndex is built once over a
+dataset, and keeps a posting list, the sorted rows of its orders, for
+every directed token pair and for every trader address. Rows are sorted
+by block, so a block range is an interval of rows, and restricting a
+posting list to it is a binary search.
+
+A query such as "all USDC->WETH orders of non arbitrageurs in blocks X to
+Y" is answered by restricting the posting list of the pair to the block
+range, intersecting it with the ones of the addresses if any are given,
+and dropping the remaining orders of excluded addresses, without scanning
+the other orders:
+
+    index = SwapIndex(dataset)
+    rows = index.query(pairs=[(USDC, WETH)], from_block=X, to_block=Y,
+                       excluded_addresses=index.arbitrageurs())
+    orders = dataset.select(rows)
+
+Tokens and addresses are given as ids of the shared interning registries,
+or as the original addresses.
+"""
+
+import numpy as np
+
+from . import interning
+
+_no_rows = np.zeros(0, dtype=np.int64)
+
+
+def _postings(keys):
+    """(distinct keys, rows grouped by key, offsets of every group): the
+    rows of the i-th key are rows[offsets[i]:offsets[i + 1]], sorted."""
+    rows = np.argsort(keys, kind='stable')
+    distinct, starts = np.unique(keys[rows], return_index=True)
+    return distinct, rows.astype(np.int64), np.append(starts, len(keys))
+
+
+def _id(registry, value):
+    """Id of a token or address, or -1 if it never appears."""
+    if isinstance(value, str):
+        return registry.ids.get(value, -1)
+    return int(value)
+
+
+def _union(postings):
+    if len(postings) == 0:
+        return _no_rows
+    return np.sort(np.concatenate(postings))
+
+
+class SwapIndex:
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.nr_tokens = int(max(dataset.sell_token.max(initial=-1),
+                                 dataset.buy_token.max(initial=-1))) + 1
+        # (keys, rows, offsets) posting lists, see _postings
+        self.pair_postings = _postings(self._pair_key(dataset.sell_token, dataset.buy_token))
+        self.address_postings = _postings(np.asarray(dataset.address, dtype=np.int64))
+
+    def _pair_key(self, sell_token, buy_token):
+        return np.asarray(sell_token, dtype=np.int64) * self.nr_tokens + buy_token
+
+    @staticmethod
+    def _posting(postings, key):
+        keys, rows, offsets = postings
+        i = np.searchsorted(keys, key)
+        if i == len(keys) or keys[i] != key:
+            return _no_rows
+        return rows[offsets[i]:offsets[i + 1]]
+
+    def block_range(self, from_block=None, to_block=None):
+        """First and last (excluded) row of the orders in the blocks
+        from_block .. to_block (both included)."""
+        d = self.dataset
+        first = 0 if from_block is None else min(max(from_block - d.first_block, 0), d.nr_blocks)
+        last = d.nr_blocks if to_block is None else min(max(to_block - d.first_block + 1, 0), d.nr_blocks)
+        return int(d.block_offsets[first]), int(d.block_offsets[max(first, last)])
+
+    def pair_rows(self, sell_token, buy_token):
+        """Rows of the orders selling sell_token for buy_token."""
+        sell_token = _id(interning.tokens, sell_token)
+        buy_token = _id(interning.tokens, buy_token)
+        if not (0 <= sell_token < self.nr_tokens and 0 <= buy_token < self.nr_tokens):
+            return _no_rows
+        return self._posting(self.pair_postings, self._pair_key(sell_token, buy_token))
+
+    def address_rows(self, address):
+        """Rows of the orders of a trader address."""
+        return self._posting(self.address_postings, _id(interning.addresses, address))
+
+    def nr_orders_by_address(self):
+        """(address ids, number of orders of every one), from the lengths
+        of the posting lists."""
+        address_ids, _, offsets = self.address_postings
+        return address_ids, np.diff(offsets)
+
+    def arbitrageurs(self, max_amount_swaps_retail_traders=50):
+        """Addresses with more orders than max_amount_swaps_retail_traders,
+        as utils.filter_out_arbitrageur_swaps counts them. Orders without
+        an address (id -1) are not counted."""
+        address_ids, counts = self.nr_orders_by_address()
+        return address_ids[(counts > max_amount_swaps_retail_traders) & (address_ids >= 0)]
+
+    def query(self, pairs=None, addresses=None, excluded_addresses=None,
+              from_block=None, to_block=None):
+        """Sorted rows of the orders of any of the (sell token, buy token)
+        pairs, placed by any of the addresses, in the blocks from_block ..
+        to_block, and not placed by any of the excluded_addresses.
+
+        Criteria that are None do not restrict the result.
+        """
+        first, last = self.block_range(from_block, to_block)
+
+        def in_range(posting):
+            return posting[np.searchsorted(posting, first):np.searchsorted(posting, last)]
+
+        candidates = []
+        if pairs is not None:
+            candidates.append(_union([in_range(self.pair_rows(*p)) for p in pairs]))
+        if addresses is not None:
+            candidates.append(_union([in_range(self.address_rows(a)) for a in addresses]))
+        if not candidates:
+            rows = np.arange(first, last, dtype=np.int64)
+        else:
+            # the shortest posting list first, so every step is cheaper
+            candidates.sort(key=len)
+            rows = candidates[0]
+            for posting in candidates[1:]:
+                rows = np.intersect1d(rows, posting, assume_unique=True)
+        if excluded_addresses is not None and len(rows) > 0:
+            # only the candidates are looked at, not the excluded orders
+            excluded = [_id(interning.addresses, a) for a in excluded_addresses]
+            rows = rows[~np.isin(self.dataset.address[rows], excluded)]
+        return rows
+
+    def select(self, **criteria):
+        """Dataset of the orders matching the criteria of query."""
+        return self.dataset.select(self.query(**criteria))
+
+    def counter_orders(self, focus_pair, from_block=None, to_block=None):
+        """Rows of the counter orders of focus_pair, i.e. buying
+        focus_pair[0] and selling one of focus_pair[1:4], in a block range."""
+        return self.query(pairs=[(s, focus_pair[0]) for s in focus_pair[1:4]],
+                          from_block=from_block, to_block=to_block)
+
+    def find_order_in_next_k_blocks(self, start_block, k, focus_pair):
+        """Same as utils.find_order_in_next_k_blocks, for the blocks
+        start_block .. start_block + k - 1."""
+        first, last = self.block_range(start_block, start_block + k - 1)
+        for s in focus_pair[1:4]:
+            posting = self.pair_rows(s, focus_pair[0])
+            if np.searchsorted(posting, first) < np.searchsorted(posting, last):
+                return True
+        return False
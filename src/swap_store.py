@@ -0,0 +1,249 @@
+"""
+Columnar, memory-mapped on-disk store for the swaps exported from Dune.
+
+Parsing merged.csv with ast.literal_eval and building a dict per swap is
+slow and keeps every swap of the dataset in RAM as Python objects. This
+module converts a Dune router CSV once into a directory of flat binary
+arrays which are then memory-mapped by the analysis scripts:
+
+    block.bin        int64   block number of each swap
+    index.bin        int32   index of each swap inside its block
+    address.bin      int32   id of the trader address
+    hop_offsets.bin  int64   swap i traverses hop_tokens[hop_offsets[i]:hop_offsets[i+1]]
+    hop_tokens.bin   int32   token ids of the swap paths, concatenated
+    amounts.bin      uint64  output amount of every hop token, as 4 limbs (see amounts.py)
+    block_time.bin   int64   unix timestamp of the block of each swap, -1 if not exported
+    tokens.json              token id -> token address
+    addresses.json           address id -> trader address
+    meta.json                dtypes and lengths of the arrays above
+
+Usage:
+python -m src.swap_store data/dune_download/merged.csv data/dune_download/merged_store
+"""
+
+import argparse
+import json
+import os
+import numpy as np
+
+from .dune_csv import iter_swap_chunks
+from . import interning
+from .amounts import NR_LIMBS, AmountArray, encode
+from .interning import Interner
+from .records import Hop, Order
+from .sampling import sample_keys
+
+COLUMNS = {
+    'block': 'int64',
+    'index': 'int32',
+    'address': 'int32',
+    'hop_offsets': 'int64',
+    'hop_tokens': 'int32',
+    'amounts': 'uint64',
+    'block_time': 'int64',
+}
+
+
+class SwapStoreWriter:
+    """Appends swaps to a new store, flushing to disk every chunk_size swaps."""
+
+    def __init__(self, store_dir, chunk_size=100000):
+        os.makedirs(store_dir, exist_ok=True)
+        self.store_dir = store_dir
+        self.chunk_size = chunk_size
+        self.files = {
+            name: open(os.path.join(store_dir, name + '.bin'), 'wb')
+            for name in COLUMNS
+        }
+        self.tokens = Interner()
+        self.addresses = Interner()
+        self.nr_swaps = 0
+        self.nr_hops = 0
+        self.buffers = {name: [] for name in COLUMNS}
+        self.buffers['hop_offsets'].append(0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def append(self, block_number, index, address, path, output_amounts,
+               block_time=None):
+        assert len(path) == len(output_amounts)
+        self.buffers['hop_tokens'] += [self.tokens.intern(t) for t in path]
+        self.buffers['amounts'].append(encode(output_amounts))
+        self.buffers['block'].append(block_number)
+        self.buffers['index'].append(index)
+        self.buffers['block_time'].append(block_time if block_time is not None else -1)
+        self.buffers['address'].append(self.addresses.intern(address))
+        self.nr_swaps += 1
+        self.nr_hops += len(path)
+        self.buffers['hop_offsets'].append(self.nr_hops)
+        if len(self.buffers['block']) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        for name, dtype in COLUMNS.items():
+            if name == 'amounts':
+                self.files[name].write(b''.join(self.buffers[name]))
+            else:
+                np.asarray(self.buffers[name], dtype=dtype).tofile(self.files[name])
+            self.buffers[name] = []
+
+    def close(self):
+        self.flush()
+        for f in self.files.values():
+            f.close()
+        write_json(os.path.join(self.store_dir, 'tokens.json'), self.tokens.values)
+        write_json(os.path.join(self.store_dir, 'addresses.json'), self.addresses.values)
+        write_json(os.path.join(self.store_dir, 'meta.json'), {
+            'nr_swaps': self.nr_swaps,
+            'nr_hops': self.nr_hops,
+            'columns': COLUMNS
+        })
+
+
+class SwapStore:
+    """Read-only view of a store created by SwapStoreWriter.
+
+    All arrays are memory-mapped, so opening a store is cheap regardless
+    of its size and only the pages that are actually touched are read.
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        meta = read_json(os.path.join(store_dir, 'meta.json'))
+        self.nr_swaps = meta['nr_swaps']
+        self.nr_hops = meta['nr_hops']
+        for name, dtype in meta['columns'].items():
+            setattr(self, name, self._memmap(name, dtype))
+        # Stores created before amounts and block times were added do not
+        # have them.
+        self.amounts = AmountArray(self.amounts.reshape(-1, NR_LIMBS)) \
+            if 'amounts' in meta['columns'] else None
+        if 'block_time' not in meta['columns']:
+            self.block_time = None
+        self.tokens = Interner(read_json(os.path.join(store_dir, 'tokens.json')))
+        self.addresses = Interner(read_json(os.path.join(store_dir, 'addresses.json')))
+        self._interned_ids = None
+
+    def _memmap(self, name, dtype):
+        filename = os.path.join(self.store_dir, name + '.bin')
+        if os.path.getsize(filename) == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(filename, dtype=dtype, mode='r')
+
+    def __len__(self):
+        return self.nr_swaps
+
+    def interned_ids(self):
+        """(token ids, address ids) of the shared interning registries for
+        the store vocabularies, indexed by store id. Registries only grow,
+        so they are computed once per store and reused by every load."""
+        if self._interned_ids is None:
+            self._interned_ids = (interning.tokens.intern_array(self.tokens.values),
+                                  interning.addresses.intern_array(self.addresses.values))
+        return self._interned_ids
+
+    def path(self, i):
+        """Token ids traversed by swap i."""
+        return self.hop_tokens[self.hop_offsets[i]:self.hop_offsets[i + 1]]
+
+    def output_amounts(self, i):
+        """Exact output amounts of swap i, as python ints."""
+        return self.amounts[self.hop_offsets[i]:self.hop_offsets[i + 1]].to_ints()
+
+
+def read_json(filename):
+    with open(filename, 'r') as f:
+        return json.load(f)
+
+
+def write_json(filename, data):
+    with open(filename, 'w+') as f:
+        json.dump(data, f)
+
+
+def convert_csv_to_store(csv_filename, store_dir):
+    with SwapStoreWriter(store_dir) as writer:
+        for chunk in iter_swap_chunks(csv_filename):
+            for swap in chunk:
+                writer.append(swap['block_number'], swap['index'], swap['address'],
+                              swap['path'], swap['output_amounts'], swap.get('block_time'))
+    return SwapStore(store_dir)
+
+
+def read_swaps_from_store(store_dir, read_swaps_splitted=False, data_usage_percentage=50,
+                          intern=False, seed=0):
+    """Same as read_csv.read_swaps_from_csv, but reading from a swap store.
+
+    For the same seed, the sampled swaps are the same as the ones sampled
+    by read_swaps_from_csv from the csv file the store was created from."""
+    store = SwapStore(store_dir)
+    if intern:
+        # Translate store ids to ids of the shared registries.
+        tokens, addresses = (ids.tolist() for ids in store.interned_ids())
+    else:
+        tokens = store.tokens.values
+        addresses = store.addresses.values
+    keys = sample_keys(seed, store.block, store.index)
+    rows = np.flatnonzero(keys * 100 < data_usage_percentage)
+    blocks = store.block[rows].tolist()
+    address_ids = store.address[rows].tolist()
+    # Hops of all sampled rows, decoded at once and sliced per swap.
+    hop_offsets = np.asarray(store.hop_offsets)
+    nr_hops = hop_offsets[rows + 1] - hop_offsets[rows]
+    ends = np.cumsum(nr_hops)
+    hops = np.arange(ends[-1] if len(ends) > 0 else 0) + \
+        np.repeat(hop_offsets[rows] - (ends - nr_hops), nr_hops)
+    hop_tokens = [tokens[t] for t in store.hop_tokens[hops].tolist()]
+    amounts = store.amounts[hops].to_ints() if store.amounts is not None else None
+    ends = ends.tolist()
+    orders = dict()
+    for i, (block_number, address_id) in enumerate(zip(blocks, address_ids)):
+        swap_hops = slice(ends[i - 1] if i > 0 else 0, ends[i])
+        path = hop_tokens[swap_hops]
+        output_amounts = amounts[swap_hops] if amounts is not None else None
+        address = addresses[address_id]
+        entry = orders.setdefault(block_number, [])
+        if read_swaps_splitted:
+            for hop, (sell_token, buy_token) in enumerate(zip(path, path[1:])):
+                entry.append(
+                    Hop(sellToken=sell_token,
+                        buyToken=buy_token,
+                        amounts=output_amounts,
+                        address=address,
+                        block=block_number,
+                        hop=hop))
+        else:
+            entry.append(
+                Order(sellToken=path[0],
+                      buyToken=path[-1],
+                      address=address,
+                      amounts=output_amounts,
+                      block=block_number))
+    return orders
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Convert a Dune router swaps csv file into a memory-mapped swap store.')
+
+    parser.add_argument(
+        'csv_file',
+        type=str,
+        help='Path to input csv file (e.g. data/dune_download/merged.csv).'
+    )
+
+    parser.add_argument(
+        'store_dir',
+        type=str,
+        help='Path to output store directory.'
+    )
+
+    args = parser.parse_args()
+
+    store = convert_csv_to_store(args.csv_file, args.store_dir)
+    print(f"Stored {len(store)} swaps over {len(store.tokens)} tokens "
+          f"and {len(store.addresses)} addresses in {args.store_dir}")
@@ -1,25 +1,37 @@
+from collections import Counter
 
-def filter_out_arbitrageur_swaps(swaps_by_block,
-                                 max_amount_swaps_retail_traders=50):
+from . import interning
+
+
+def find_arbitrageurs(swap_counts, max_amount_swaps_retail_traders=50,
+                      fraction_to_remove=None):
     # Arbitrageur traders are identified as frequent traders
     # frequent traders are identified as traders with more than
-    # max_amount_swaps_retail_traders swaps
+    # max_amount_swaps_retail_traders swaps, or, if fraction_to_remove is
+    # given, as the fraction_to_remove most active traders (as in
+    # common.remove_most_active_users).
+    # swap_counts is a collections.Counter of the swaps of every trader.
+    if fraction_to_remove is not None:
+        nr_to_remove = round(len(swap_counts) * fraction_to_remove)
+        return {owner for owner, _ in swap_counts.most_common(nr_to_remove)}
+    return {owner for owner, count in swap_counts.items()
+            if count > max_amount_swaps_retail_traders}
+
+
+def filter_out_arbitrageur_swaps(swaps_by_block,
+                                 max_amount_swaps_retail_traders=50,
+                                 fraction_to_remove=None):
     print("Before filtering out arbitrageurs, the data contains ",
           count_swaps(swaps_by_block), " swaps")
-    owners = {o['address']
-              for k in swaps_by_block.keys()
-              for o in swaps_by_block.get(k, [])}
-    for owner in owners:
-        count = 0
-        for block_index in swaps_by_block.keys():
-            for swaps in swaps_by_block.get(block_index):
-                if swaps['address'] == owner:
-                    count += 1
-        if count > max_amount_swaps_retail_traders:
-            for block_index in swaps_by_block.keys():
-                swaps_by_block[block_index] = [swaps for swaps in
-                                               swaps_by_block.get(block_index)
-                                               if swaps['address'] != owner]
+    swap_counts = Counter(
+        o['address'] for swaps in swaps_by_block.values() for o in swaps
+    )
+    arbitrageurs = find_arbitrageurs(
+        swap_counts, max_amount_swaps_retail_traders, fraction_to_remove)
+    for block_index, swaps in swaps_by_block.items():
+        swaps_by_block[block_index] = [
+            swap for swap in swaps if swap['address'] not in arbitrageurs
+        ]
 
     print("After filtering out arbitrageurs, the data contains ",
           count_swaps(swaps_by_block), " swaps")
@@ -33,6 +45,13 @@ def count_swaps(swaps_by_block):
     return data_points
 
 
+def pair_label(focus_pair):
+    """Readable name of a focus pair, whose tokens might be interned ids."""
+    return "-".join(
+        interning.tokens[t] if isinstance(t, int) else t for t in focus_pair
+    )
+
+
 def generate_focus_pairs(sorted_blocks, swaps_by_block):
     focus_pairs = [
         [o['sellToken'], o['buyToken']]
@@ -46,11 +65,12 @@ def find_order_in_block(
     block, focus_pair,
     swaps_by_block
 ):
+    # Counter orders buy focus_pair[0] and sell focus_pair[1], or one of
+    # the alternatives in focus_pair[2] and focus_pair[3] if given.
+    buy_token = focus_pair[0]
+    sell_tokens = focus_pair[1:4]
     for o in swaps_by_block.get(block, []):
-        if focus_pair[0] == o['buyToken'] and \
-           (focus_pair[1] == o['sellToken'] or
-            (len(focus_pair) >= 3 and focus_pair[2] == o['sellToken']) or
-                (len(focus_pair) >= 4 and focus_pair[3] == o['sellToken'])):
+        if o['buyToken'] == buy_token and o['sellToken'] in sell_tokens:
             return True
     return False
 
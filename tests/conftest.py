@@ -0,0 +1,21 @@
+"""
+Fixtures shared by the tests: a swap store built from the sample Dune export.
+"""
+
+import pytest
+
+from src.swap_store import SwapStore, convert_csv_to_store
+
+from .dict_loops import SAMPLE_CSV
+
+
+@pytest.fixture(scope='session')
+def store_dir(tmp_path_factory):
+    store_dir = str(tmp_path_factory.mktemp('store'))
+    convert_csv_to_store(SAMPLE_CSV, store_dir)
+    return store_dir
+
+
+@pytest.fixture(scope='session')
+def store(store_dir):
+    return SwapStore(store_dir)
@@ -0,0 +1,62 @@
+"""
+The original dict loops of probability_of_match.py (see utils.py), which
+every engine is compared with, over the sample Dune export.
+"""
+
+import os
+
+from src.read_csv import read_swaps_from_csv
+from src.utils import filter_out_arbitrageur_swaps, find_order_in_next_k_blocks, \
+    generate_focus_pairs
+
+SAMPLE_CSV = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'dune_download',
+    'swaps_data_from_router_11740000-11741000.csv')
+
+
+def truncated_csv(csv_filename, last_block, filename):
+    """Copy of the swaps of a csv file up to last_block."""
+    with open(csv_filename) as f, open(filename, 'w') as out:
+        out.write(f.readline())
+        for line in f:
+            if int(line.split(',', 1)[0]) > last_block:
+                break
+            out.write(line)
+    return filename
+
+
+def read_swaps_by_block(split, data_usage_percentage, seed=0,
+                        max_amount_swaps_retail_traders=50, intern=True):
+    """swaps_by_block as probability_of_match.py builds it: read from the
+    sample csv, with every block in between filled in, and without the
+    orders of arbitrageurs (unless max_amount_swaps_retail_traders is None)."""
+    swaps_by_block = read_swaps_from_csv(
+        SAMPLE_CSV, split, data_usage_percentage, intern=intern, seed=seed)
+    for block in range(min(swaps_by_block.keys()), max(swaps_by_block.keys())):
+        if block not in swaps_by_block.keys():
+            swaps_by_block[block] = []
+    if max_amount_swaps_retail_traders is not None:
+        swaps_by_block = filter_out_arbitrageur_swaps(
+            swaps_by_block, max_amount_swaps_retail_traders)
+    return swaps_by_block
+
+
+def dict_loop_focus_pairs(swaps_by_block):
+    return sorted(generate_focus_pairs(sorted(swaps_by_block.keys(), reverse=True), swaps_by_block))
+
+
+def dict_loop_probabilities(swaps_by_block, focus_pairs, waiting_time):
+    """Probability of every focus pair, computed as probability_of_match.py did."""
+    sorted_blocks = sorted(swaps_by_block.keys(), reverse=True)
+    nr_orders = len(sorted_blocks) - waiting_time
+    return [
+        sum(find_order_in_next_k_blocks(
+            block_index, waiting_time, focus_pair, swaps_by_block, sorted_blocks)
+            for block_index in range(nr_orders)) / nr_orders
+        for focus_pair in focus_pairs
+    ]
+
+
+def some_pairs(focus_pairs, nr_pairs=60):
+    """Every few focus pairs, so that the dict loops stay fast."""
+    return focus_pairs[::max(len(focus_pairs) // nr_pairs, 1)]
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from src.amounts import AmountArray
+
+# Amounts around every limb boundary and up to the largest uint256.
+AMOUNTS = [0, 1, 2 ** 53 + 1, 2 ** 64 - 1, 2 ** 64, 2 ** 128 + 2 ** 75 + 1,
+           2 ** 255, 2 ** 256 - 2 ** 203, 2 ** 256 - 2 ** 202 - 1, 2 ** 256 - 1,
+           5126709960000000000000000]
+
+
+def test_round_trip():
+    amounts = AmountArray.from_ints(AMOUNTS)
+    assert len(amounts) == len(AMOUNTS)
+    assert amounts.to_ints() == AMOUNTS
+    assert [amounts[i] for i in range(len(AMOUNTS))] == AMOUNTS
+    assert amounts[2:5].to_ints() == AMOUNTS[2:5]
+
+
+def test_out_of_range():
+    with pytest.raises(ValueError):
+        AmountArray.from_ints([2 ** 256])
+    with pytest.raises(ValueError):
+        AmountArray.from_ints([-1])
+
+
+def test_to_float():
+    rng = np.random.default_rng(0)
+    # random amounts of every bit length, including halfway cases
+    amounts = AMOUNTS + [int(rng.integers(1, 2 ** 63)) >> int(rng.integers(0, 63)) << int(s)
+                         for s in rng.integers(0, 194, 1000)]
+    amounts += [(2 ** 53 + 1) << s for s in range(0, 203)]
+    assert AmountArray.from_ints(amounts).to_float().tolist() == [float(a) for a in amounts]
+
+
+def test_to_human():
+    amounts = AmountArray.from_ints([10 ** 18, 5 * 10 ** 6])
+    assert amounts.to_human([18, 6]).tolist() == pytest.approx([1.0, 5.0])
+
+
+def test_sum():
+    amounts = [2 ** 256 - 1] * 3 + AMOUNTS
+    assert AmountArray.from_ints(amounts).sum() == sum(amounts)
@@ -0,0 +1,42 @@
+import io
+import json
+
+import pytest
+
+from src.compression import JsonStream, iter_json, load_json_members, open_file
+
+DOCUMENT = {
+    'tokens': {'A': {'decimals': 18}, 'B': {'decimals': 6}},
+    'orders': [{'sellToken': 'A', 'amount': 12345678901234567890}, [], {}, 1.5e-7, None, 'x'],
+    'prices': {'A': 1, 'B': 0.25},
+    'empty': [],
+}
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 1 << 16])
+def test_json_stream(chunk_size):
+    stream = JsonStream(io.StringIO(json.dumps(DOCUMENT, indent=1)), chunk_size)
+    decoded = dict()
+    for key in stream.keys():
+        if key == 'orders':
+            decoded[key] = [stream.value() for _ in stream.elements()]
+        elif key == 'prices':
+            stream.skip()
+        else:
+            decoded[key] = stream.value()
+    assert decoded == {k: v for k, v in DOCUMENT.items() if k != 'prices'}
+
+
+def test_iter_json(tmp_path):
+    filename = str(tmp_path / 'document.json.gz')
+    with open_file(filename, 'w') as f:
+        json.dump(DOCUMENT, f)
+    with open_file(filename) as f:
+        assert list(iter_json(f, 'orders')) == DOCUMENT['orders']
+    with open_file(filename) as f:
+        assert dict(iter_json(f, 'prices')) == DOCUMENT['prices']
+    with open_file(filename) as f:
+        assert load_json_members(f, ['tokens', 'empty']) == \
+            {'tokens': DOCUMENT['tokens'], 'empty': []}
+    with open_file(filename) as f, pytest.raises(KeyError):
+        list(iter_json(f, 'missing'))
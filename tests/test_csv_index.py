@@ -0,0 +1,76 @@
+import gzip
+import os
+import shutil
+
+import pytest
+
+from src.csv_index import build_block_index, open_block_range
+from src.read_csv import read_swaps_from_csv
+
+from .dict_loops import SAMPLE_CSV
+
+RANGES = [(None, None), (11740000, 11740000), (11740123, 11740456), (11740999, None),
+          (None, 11740010), (11739000, 11739999), (11741001, 11742000)]
+
+
+@pytest.fixture(scope='module', params=['', '.gz'])
+def indexed_csv(request, tmp_path_factory):
+    """Copy of the sample csv, compressed or not, with a dense index."""
+    filename = str(tmp_path_factory.mktemp('csv') / ('swaps.csv' + request.param))
+    with open(SAMPLE_CSV, 'rb') as f, (gzip.open if request.param else open)(filename, 'wb') as out:
+        shutil.copyfileobj(f, out)
+    build_block_index(filename, stride=10000)
+    return filename
+
+
+def rows(lines):
+    return [line.rstrip('\r\n') for line in lines]
+
+
+@pytest.mark.parametrize('from_block, to_block', RANGES)
+def test_open_block_range(indexed_csv, from_block, to_block):
+    with open(SAMPLE_CSV) as f:
+        header, *lines = rows(f)
+    expected = [line for line in lines if
+                (from_block is None or int(line.split(',', 1)[0]) >= from_block) and
+                (to_block is None or int(line.split(',', 1)[0]) <= to_block)]
+    with open_block_range(indexed_csv, from_block, to_block) as f:
+        assert rows(f) == [header] + expected
+
+
+@pytest.mark.parametrize('from_block, to_block', RANGES)
+def test_read_swaps_from_csv(indexed_csv, from_block, to_block):
+    swaps_by_block = read_swaps_from_csv(SAMPLE_CSV, True, 50)
+    expected = {
+        block: [o.to_dict() for o in orders] for block, orders in swaps_by_block.items()
+        if (from_block is None or block >= from_block) and (to_block is None or block <= to_block)}
+    swaps_by_block = read_swaps_from_csv(indexed_csv, True, 50, from_block=from_block,
+                                         to_block=to_block)
+    assert {block: [o.to_dict() for o in orders]
+            for block, orders in swaps_by_block.items()} == expected
+
+
+def test_unsorted_csv(tmp_path):
+    filename = str(tmp_path / 'swaps.csv')
+    with open(SAMPLE_CSV) as f, open(filename, 'w') as out:
+        header, *lines = f
+        out.writelines([header] + lines[::-1])
+    with pytest.raises(ValueError):
+        build_block_index(filename)
+
+
+def test_outdated_index(tmp_path):
+    filename = str(tmp_path / 'swaps.csv')
+    shutil.copy(SAMPLE_CSV, filename)
+    build_block_index(filename, stride=10000)
+    # Removing the first blocks moves every row, so the offsets of the
+    # index are wrong, and it is ignored as it is older than the file.
+    with open(SAMPLE_CSV) as f:
+        header, *lines = f
+    lines = [line for line in lines if int(line.split(',', 1)[0]) >= 11740100]
+    with open(filename, 'w') as out:
+        out.writelines([header] + lines)
+    os.utime(filename, (os.path.getmtime(filename) + 10,) * 2)
+    with open_block_range(filename, 11740500, 11740500) as f:
+        assert rows(f) == rows([header] + [
+            line for line in lines if int(line.split(',', 1)[0]) == 11740500])
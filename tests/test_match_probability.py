@@ -0,0 +1,246 @@
+"""
+The engines of match_probability.py and the modules built on them, against
+the dict loops of probability_of_match.py on the sample csv.
+"""
+
+import numpy as np
+import pytest
+
+from src.chunked_match_probability import chunked_focus_pairs, chunked_match_probabilities, \
+    store_arbitrageurs
+from src.dune_csv import iter_swaps
+from src.heavy_hitters import SlidingHeavyHitters
+from src.incremental_match_probability import update_match_statistics
+from src.match_probability import conditional_match_probabilities, match_probabilities, \
+    migration_sweep, sampled_match_probabilities, waiting_time_histograms
+from src.ring_match import ring_match_probabilities
+from src.streaming_match_probability import StreamingMatchEstimator, block_orders, iter_blocks
+from src.swap_dataset import SwapDataset
+from src.swap_index import SwapIndex
+from src.swap_store import convert_csv_to_store
+
+from .dict_loops import SAMPLE_CSV, dict_loop_focus_pairs, dict_loop_probabilities, \
+    read_swaps_by_block, some_pairs, truncated_csv
+
+WAITING_TIMES = [1, 4]
+
+
+@pytest.fixture(scope='module', params=[True, False], ids=['split', 'whole_swaps'])
+def baseline(request):
+    """(split, swaps_by_block, sampled focus pairs) of half of the swaps."""
+    split = request.param
+    swaps_by_block = read_swaps_by_block(split, 50)
+    return split, swaps_by_block, some_pairs(dict_loop_focus_pairs(swaps_by_block))
+
+
+def load(store, split, data_usage_percentage=50):
+    return SwapDataset.from_store(
+        store, split, data_usage_percentage).filter_out_arbitrageurs(verbose=False)
+
+
+def expected(swaps_by_block, focus_pairs, waiting_times=WAITING_TIMES):
+    return np.array([
+        dict_loop_probabilities(swaps_by_block, focus_pairs, k) for k in waiting_times]).T
+
+
+def test_focus_pairs(store, baseline):
+    split, swaps_by_block, _ = baseline
+    assert load(store, split).focus_pairs() == dict_loop_focus_pairs(swaps_by_block)
+
+
+def test_find_order_in_next_k_blocks(store, baseline):
+    split, swaps_by_block, focus_pairs = baseline
+    dataset = load(store, split)
+    index = SwapIndex(dataset)
+    sorted_blocks = sorted(swaps_by_block.keys(), reverse=True)
+    for focus_pair in focus_pairs[:10]:
+        for k in WAITING_TIMES:
+            hits = sum(dataset.find_order_in_next_k_blocks(p + 1, k, focus_pair)
+                       for p in range(dataset.nr_blocks - k))
+            index_hits = sum(index.find_order_in_next_k_blocks(
+                dataset.first_block + p + 1, k, focus_pair)
+                for p in range(dataset.nr_blocks - k))
+            nr_orders = len(sorted_blocks) - k
+            assert hits / nr_orders == dict_loop_probabilities(swaps_by_block, [focus_pair], k)[0]
+            assert index_hits == hits
+
+
+def test_match_probabilities(store, baseline):
+    split, swaps_by_block, focus_pairs = baseline
+    probabilities = match_probabilities(load(store, split), focus_pairs, WAITING_TIMES)
+    assert probabilities == pytest.approx(expected(swaps_by_block, focus_pairs))
+
+
+def test_match_probabilities_of_swaps_read_from_csv(baseline):
+    split, swaps_by_block, focus_pairs = baseline
+    # from_swaps_by_block interns the token addresses itself.
+    dataset = SwapDataset.from_swaps_by_block(read_swaps_by_block(split, 50, intern=False))
+    probabilities = match_probabilities(dataset, focus_pairs, WAITING_TIMES)
+    assert probabilities == pytest.approx(expected(swaps_by_block, focus_pairs))
+
+
+def test_waiting_time_histograms(store, baseline):
+    split, swaps_by_block, focus_pairs = baseline
+    max_waiting_time = 6
+    hist = waiting_time_histograms(load(store, split), focus_pairs, max_waiting_time)
+    # Orders are placed at the same blocks for all waiting times, so the
+    # cdf at k counts the orders of match_probabilities(max_waiting_time)
+    # matched within k blocks.
+    nr_orders = hist.sum(axis=1)
+    assert np.all(nr_orders == len(swaps_by_block) - max_waiting_time)
+    cdf = np.cumsum(hist[:, :-1], axis=1) / nr_orders[:, None]
+    assert cdf[:, max_waiting_time] == pytest.approx(
+        dict_loop_probabilities(swaps_by_block, focus_pairs, max_waiting_time))
+
+
+def test_waiting_time_histograms_without_orders(store):
+    dataset = SwapDataset.from_store(store, True, from_block=11740000, to_block=11740003)
+    with pytest.raises(ValueError):
+        waiting_time_histograms(dataset, dataset.focus_pairs(), 4)
+
+
+def test_conditional_match_probabilities(store, baseline):
+    split, swaps_by_block, focus_pairs = baseline
+    probabilities = conditional_match_probabilities(load(store, split), focus_pairs, WAITING_TIMES)
+    sorted_blocks = sorted(swaps_by_block.keys())
+    for i, (a, b) in enumerate(focus_pairs):
+        for j, k in enumerate(WAITING_TIMES):
+            # blocks with an order of the pair, and all their k blocks in the data
+            order_blocks = [
+                p for p, block in enumerate(sorted_blocks)
+                if p <= len(sorted_blocks) - k and any(
+                    o['sellToken'] == a and o['buyToken'] == b for o in swaps_by_block[block])]
+            matched = [
+                p for p in order_blocks if any(
+                    o['sellToken'] == b and o['buyToken'] == a
+                    for block in sorted_blocks[p:p + k] for o in swaps_by_block[block])]
+            assert probabilities[i, j] == pytest.approx(
+                len(matched) / len(order_blocks) if order_blocks else 0)
+
+
+def test_migration_sweep(store, baseline):
+    split, _, focus_pairs = baseline
+    dataset = SwapDataset.from_store(store, split)
+    percentages = [25, 50]
+    probabilities = migration_sweep(dataset, focus_pairs, percentages, WAITING_TIMES,
+                                    verbose=False)
+    for j, percentage in enumerate(percentages):
+        swaps_by_block = read_swaps_by_block(split, percentage)
+        assert probabilities[:, j, :] == pytest.approx(expected(swaps_by_block, focus_pairs))
+
+
+def test_chunked_match_probabilities(store, baseline):
+    split, swaps_by_block, focus_pairs = baseline
+    arbitrageurs = store_arbitrageurs(store, split, 50)
+    assert chunked_focus_pairs(store, 97, split, 50, arbitrageurs=arbitrageurs) == \
+        dict_loop_focus_pairs(swaps_by_block)
+    probabilities = chunked_match_probabilities(
+        store, focus_pairs, WAITING_TIMES, 97, split, 50, arbitrageurs=arbitrageurs)
+    assert probabilities == pytest.approx(expected(swaps_by_block, focus_pairs))
+
+
+@pytest.mark.parametrize('max_amount_swaps_retail_traders', [50, 10])
+def test_update_match_statistics(tmp_path, store, max_amount_swaps_retail_traders):
+    # With a low threshold, the new blocks make arbitrageurs of addresses
+    # whose orders are in the old blocks.
+    old_store = convert_csv_to_store(
+        truncated_csv(SAMPLE_CSV, 11740600, str(tmp_path / 'old.csv')), str(tmp_path / 'old_store'))
+    results_dir = str(tmp_path / 'results')
+    for s in (old_store, store):
+        focus_pairs, probabilities = update_match_statistics(
+            s, results_dir, WAITING_TIMES, data_usage_percentage=50,
+            max_amount_swaps_retail_traders=max_amount_swaps_retail_traders, chunk_nr_blocks=150)
+
+    swaps_by_block = read_swaps_by_block(True, 50, 0, max_amount_swaps_retail_traders)
+    assert focus_pairs == dict_loop_focus_pairs(swaps_by_block)
+    rows = some_pairs(list(range(len(focus_pairs))))
+    assert probabilities[rows] == pytest.approx(
+        expected(swaps_by_block, [focus_pairs[i] for i in rows]))
+
+
+def test_ring_match_probabilities_of_direct_counter_orders(store, baseline):
+    split, swaps_by_block, focus_pairs = baseline
+    dataset = load(store, split)
+    for k in WAITING_TIMES:
+        probabilities, example_rings = ring_match_probabilities(
+            dataset, focus_pairs, k, max_ring_length=2)
+        assert probabilities == pytest.approx(dict_loop_probabilities(swaps_by_block, focus_pairs, k))
+        assert example_rings == {}
+
+
+def test_ring_match_probabilities_of_longer_rings(store, baseline):
+    split, _, focus_pairs = baseline
+    dataset = load(store, split)
+    direct, _ = ring_match_probabilities(dataset, focus_pairs, 4, max_ring_length=2)
+    probabilities, example_rings = ring_match_probabilities(dataset, focus_pairs, 4)
+    assert np.all(probabilities >= direct)
+    for i, (block, ring) in example_rings.items():
+        a, b = focus_pairs[i]
+        assert ring[0] == a and ring[1] == b and ring[-1] == a and len(ring) <= 4
+
+
+def test_sampled_match_probabilities(store, baseline):
+    split, swaps_by_block, focus_pairs = baseline
+    dataset = load(store, split)
+    # Sampling every block gives the exact probabilities.
+    probabilities, error_bounds, nr_samples = sampled_match_probabilities(
+        dataset, focus_pairs, 4, target_width=0.0, nr_strata=20)
+    assert probabilities == pytest.approx(dict_loop_probabilities(swaps_by_block, focus_pairs, 4))
+    assert np.all(nr_samples == dataset.nr_blocks - 4)
+    # Otherwise, the exact probabilities are within the error bounds of
+    # almost every pair.
+    probabilities, error_bounds, _ = sampled_match_probabilities(
+        dataset, focus_pairs, 4, target_width=0.1, nr_strata=20)
+    exact = match_probabilities(dataset, focus_pairs, [4])[:, 0]
+    assert np.mean(np.abs(probabilities - exact) <= error_bounds) >= 0.9
+
+
+def test_streaming_match_estimator():
+    swaps_by_block = read_swaps_by_block(True, 100, max_amount_swaps_retail_traders=None)
+    estimator = StreamingMatchEstimator(4)
+    with open(SAMPLE_CSV) as f:
+        for block_number, swaps in iter_blocks(iter_swaps(f)):
+            estimator.add_block(block_number, block_orders(swaps))
+    probabilities = estimator.probabilities()
+    focus_pairs = dict_loop_focus_pairs(swaps_by_block)
+    assert sorted(probabilities) == focus_pairs
+    focus_pairs = some_pairs(focus_pairs)
+    assert [probabilities[p] for p in focus_pairs] == pytest.approx(
+        dict_loop_probabilities(swaps_by_block, focus_pairs, 4))
+
+
+def test_swap_index_query(store):
+    dataset = load(store, True, 100)
+    index = SwapIndex(dataset)
+    (a, b), = some_pairs(dataset.focus_pairs(), 1)[:1]
+    from_block, to_block = 11740200, 11740500
+    arbitrageurs = SwapIndex(SwapDataset.from_store(store, True)).arbitrageurs()
+    rows = index.query(pairs=[(a, b)], from_block=from_block, to_block=to_block,
+                       excluded_addresses=arbitrageurs)
+    expected_rows = np.flatnonzero(
+        (dataset.sell_token == a) & (dataset.buy_token == b) &
+        (dataset.block >= from_block) & (dataset.block <= to_block) &
+        ~np.isin(dataset.address, arbitrageurs))
+    assert rows.tolist() == expected_rows.tolist()
+
+
+def test_sliding_heavy_hitters_bounds(store):
+    dataset = SwapDataset.from_store(store, True)
+    heavy_hitters = SlidingHeavyHitters(300, capacity=50, nr_panes=5)
+    for p in range(dataset.nr_blocks):
+        heavy_hitters.add_block(
+            dataset.first_block + p, dataset.address[dataset.orders_in_block(p)].tolist())
+    # Counts are over the panes of the window, which start at most a pane
+    # before it.
+    rows = slice(dataset.block_offsets[heavy_hitters.panes[0][0] - dataset.first_block], None)
+    addresses, counts = np.unique(dataset.address[rows], return_counts=True)
+    counts = dict(zip(addresses.tolist(), counts.tolist()))
+    for address, count in counts.items():
+        lower_bound, upper_bound = heavy_hitters.bounds(address)
+        assert lower_bound <= count <= upper_bound
+    threshold = 10
+    max_error = sum(summary.min_count() for _, summary in heavy_hitters.panes)
+    flagged = heavy_hitters.heavy_hitters(threshold)
+    assert {a for a, c in counts.items() if c > threshold + max_error} <= flagged
+    assert {a for a, c in counts.items() if c > threshold} >= flagged
+    assert len(flagged) > 0
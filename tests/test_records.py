@@ -0,0 +1,63 @@
+"""
+Records in place of the dicts they replace.
+"""
+
+import pytest
+
+from src.records import Hop, Order, Swap
+
+
+def test_dict_access():
+    order = Order(sellToken='A', buyToken='B', amounts=[1, 2, 3], block=7)
+    as_dict = {'sellToken': 'A', 'buyToken': 'B', 'amounts': [1, 2, 3], 'block': 7}
+    assert order['sellToken'] == 'A'
+    assert order.get('block') == 7
+    assert order.to_dict() == as_dict
+    assert order.keys() == list(as_dict.keys())
+    assert (order.sellAmount, order.buyAmount) == (1, 3)
+    order['address'] = 'x'
+    assert order['address'] == 'x'
+
+
+def test_missing_fields():
+    order = Order(sellToken='A', buyToken=None)
+    # as with a dict, a field set to None is in the record, an unset one is not
+    assert 'buyToken' in order and order['buyToken'] is None
+    assert 'address' not in order
+    assert order.get('address', 'none') == 'none'
+    with pytest.raises(KeyError):
+        order['address']
+    with pytest.raises(KeyError):
+        order['price'] = 1
+    del order['sellToken']
+    assert 'sellToken' not in order
+    with pytest.raises(KeyError):
+        del order['sellToken']
+    assert 'price' not in order
+    with pytest.raises(TypeError):
+        Order(price=1)
+
+
+def test_hop_amounts():
+    hop = Hop(sellToken='B', buyToken='C', amounts=[1, 2, 3], hop=1)
+    assert (hop['sellToken'], hop.sellAmount, hop.buyAmount) == ('B', 2, 3)
+    assert hop.to_dict()['hop'] == 1
+
+
+def test_hashable():
+    # Records are mutable, so they compare and hash by identity, as
+    # objects and unlike dicts.
+    a = Order(sellToken='A', buyToken='B')
+    b = Order(sellToken='A', buyToken='B')
+    assert a != b and a.to_dict() == b.to_dict()
+    assert len({a, b}) == 2 and a in [a] and b not in [a]
+    a['buyToken'] = 'C'
+    assert a in {a}
+
+
+def test_from_row():
+    row = {'block_number': 1, 'index': 2, 'path': ['A', 'B'], 'unnamed': 'x'}
+    swap = Swap.from_row(row)
+    assert swap.to_dict() == {'block_number': 1, 'index': 2, 'path': ['A', 'B']}
+    swap['amm_balances'] = {}
+    assert 'amm_balances' in swap and 'unnamed' not in swap
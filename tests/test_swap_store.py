@@ -0,0 +1,56 @@
+from src.ingest_swaps import find_overlapping_ranges, ingest
+from src.read_csv import read_swaps_from_csv
+from src.swap_dataset import SwapDataset
+from src.swap_store import read_swaps_from_store
+
+from .dict_loops import SAMPLE_CSV, truncated_csv
+
+
+def as_dicts(swaps_by_block):
+    return {block: [o.to_dict() for o in orders] for block, orders in swaps_by_block.items()}
+
+
+def test_read_swaps_from_store(store_dir):
+    for split in (True, False):
+        for intern in (True, False):
+            assert as_dicts(read_swaps_from_store(store_dir, split, 50, intern, seed=3)) == \
+                as_dicts(read_swaps_from_csv(SAMPLE_CSV, split, 50, intern, seed=3))
+
+
+def test_from_store_range(store):
+    dataset = SwapDataset.from_store(store, True, 50)
+    window = SwapDataset.from_store(store, True, 50, from_block=11740100, to_block=11740199)
+    assert (window.first_block, window.nr_blocks) == (11740100, 100)
+    rows = slice(dataset.block_offsets[100], dataset.block_offsets[200])
+    assert window.block.tolist() == dataset.block[rows].tolist()
+    assert window.sell_token.tolist() == dataset.sell_token[rows].tolist()
+    assert window.address.tolist() == dataset.address[rows].tolist()
+    assert [a.tolist() for a in window.amounts()] == [a[rows].tolist() for a in dataset.amounts()]
+
+
+def test_ingest(tmp_path, store_dir):
+    # Two overlapping files, the second one with its blocks in reverse
+    # order (swaps with the same (block, index) keep their order).
+    first = truncated_csv(SAMPLE_CSV, 11740600, str(tmp_path / 'first.csv'))
+    lines_by_block = dict()
+    with open(SAMPLE_CSV) as f:
+        header = f.readline()
+        for line in f:
+            lines_by_block.setdefault(int(line.split(',', 1)[0]), []).append(line)
+    second = str(tmp_path / 'second.csv')
+    with open(second, 'w') as out:
+        out.write(header)
+        for block in sorted(lines_by_block, reverse=True):
+            if block >= 11740500:
+                out.writelines(lines_by_block[block])
+    merged_dir = str(tmp_path / 'merged')
+    ingest([first, second], merged_dir, nr_processes=2)
+    assert as_dicts(read_swaps_from_store(merged_dir, True, 100)) == \
+        as_dicts(read_swaps_from_store(store_dir, True, 100))
+
+
+def test_find_overlapping_ranges():
+    parsed_files = [('a', None, 10, 1, 5), ('b', None, 10, 6, 9), ('c', None, 10, 3, 7),
+                    ('d', None, 0, None, None)]
+    assert find_overlapping_ranges(parsed_files) == [((1, 5, 'a'), (3, 7, 'c')),
+                                                     ((3, 7, 'c'), (6, 9, 'b'))]